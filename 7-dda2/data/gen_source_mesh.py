@@ -4,12 +4,157 @@
 # Use of this source code is governed by a GNU GPLv3 license that can be found
 # in the LICENSE file.
 
+# Generates the source mesh of the deformation.
+#
+#   python gen_source_mesh.py                        # ico_sphere(4)
+#   python gen_source_mesh.py --init hull            # convex hull of bunny.obj
+#   python gen_source_mesh.py --init visual_hull     # carved from silhouettes
+#   python gen_source_mesh.py --init shrinkwrap      # sphere wrapped on bunny.obj
+#
+# Except for the sphere, every initialization is an ico_sphere(level) moved
+# onto the target, hence it keeps the genus 0 topology and the vertex count of
+# the sphere. They are written in the normalized coordinates of the target
+# (centered at the vertex mean, scaled into the unit box), the frame the
+# deformation loop works in. The deformation loop therefore loads source.obj as
+# is and only normalizes the target, renormalizing an initialization by its own
+# mean and extent would shift and scale it off the target. Results are cached
+# per target file in .cache.
+
+import os
+import math
+import shutil
+import hashlib
+import argparse
 import torch
 from pytorch3d.utils import ico_sphere
-from pytorch3d.io import save_obj
+from pytorch3d.io import load_obj, save_obj
+from pytorch3d.ops import knn_points, sample_points_from_meshes
+from pytorch3d.structures import Meshes
+from pytorch3d.renderer import (
+    look_at_view_transform,
+    FoVOrthographicCameras,
+    MeshRasterizer,
+    RasterizationSettings,
+)
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 print("use: ", device)
 
-m = ico_sphere(level=4)
-save_obj("source.obj", m.verts_packed(), m.faces_packed())
\ No newline at end of file
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+def load_target(path: str) -> Meshes:
+    verts, faces, _ = load_obj(path)
+    verts = verts - verts.mean(0)
+    verts = verts / verts.abs().max()
+    return Meshes(verts=[verts.to(device)], faces=[faces.verts_idx.to(device)])
+
+def fibonacci_directions(n: int) -> torch.Tensor:
+    i = torch.arange(n, dtype=torch.float32, device=device) + 0.5
+    z = 1 - 2 * i / n
+    r = (1 - z ** 2).sqrt()
+    phi = i * math.pi * (3 - math.sqrt(5))
+    return torch.stack([r * phi.cos(), r * phi.sin(), z], 1)
+
+def smooth(verts: torch.Tensor, edges: torch.Tensor, weight: float) -> torch.Tensor:
+    """Moves every vertex by weight towards the mean of its neighbors."""
+    src = torch.cat([edges[:, 0], edges[:, 1]])
+    dst = torch.cat([edges[:, 1], edges[:, 0]])
+    mean = torch.zeros_like(verts).index_add_(0, src, verts[dst])
+    mean = mean / torch.bincount(src, minlength=verts.shape[0])[:, None]
+    return verts + weight * (mean - verts)
+
+def sphere(target: Meshes, level: int) -> Meshes:
+    return ico_sphere(level, device)
+
+def hull(target: Meshes, level: int, n_planes: int = 4096, chunk: int = 4096) -> Meshes:
+    """Projects the sphere vertices radially onto the convex hull of the
+    target, approximated by the supporting planes of n_planes directions."""
+    s = ico_sphere(level, device)
+    normals = fibonacci_directions(n_planes)
+    support = (target.verts_packed() @ normals.T).max(0)[0]
+    dirs = s.verts_packed()
+    radii = []
+    for d in dirs.split(chunk):
+        # distance along d to every plane in front of the origin
+        cos = d @ normals.T
+        t = torch.where(cos > 1e-6, support / cos.clamp(min=1e-6), torch.full_like(cos, float("inf")))
+        radii.append(t.min(1)[0])
+    return Meshes(verts=[dirs * torch.cat(radii)[:, None]], faces=[s.faces_packed()])
+
+def wrap(points: torch.Tensor, level: int, iterations: int = 100,
+         step: float = 0.5, weight: float = 0.5) -> Meshes:
+    """Shrinks a sphere around points onto them: each iteration attracts the
+    vertices to their nearest point and smooths the result."""
+    s = ico_sphere(level, device)
+    verts = s.verts_packed() * points.norm(dim=1).max() * 1.05
+    edges = s.edges_packed()
+    for i in range(iterations):
+        nearest = knn_points(verts[None], points[None], K=1, return_nn=True).knn[0, :, 0]
+        verts = verts + step * (nearest - verts)
+        verts = smooth(verts, edges, weight * (1 - i / iterations))
+    return Meshes(verts=[verts], faces=[s.faces_packed()])
+
+def shrinkwrap(target: Meshes, level: int, n_points: int = 50000) -> Meshes:
+    return wrap(sample_points_from_meshes(target, n_points)[0], level)
+
+def visual_hull(target: Meshes, level: int, resolution: int = 96, image_size: int = 256) -> Meshes:
+    """Carves a voxel grid with orthographic silhouettes of the target from
+    14 directions and wraps a sphere onto the boundary voxels."""
+    elev = torch.tensor([0.0] * 8 + [60.0] * 3 + [-60.0] * 3)
+    azim = torch.tensor([45.0 * i for i in range(8)] + [0.0, 120.0, 240.0] * 2)
+    R, T = look_at_view_transform(3, elev, azim, device=device)
+    cameras = FoVOrthographicCameras(R=R, T=T, min_x=-1.8, max_x=1.8, min_y=-1.8, max_y=1.8, device=device)
+    rasterizer = MeshRasterizer(cameras=cameras, raster_settings=RasterizationSettings(
+        image_size=image_size, blur_radius=0.0, faces_per_pixel=1,
+    ))
+    masks = rasterizer(target.extend(len(elev))).pix_to_face[..., 0] >= 0
+
+    axis = (torch.arange(resolution, device=device) + 0.5) / resolution * 2.2 - 1.1
+    grid = torch.stack(torch.meshgrid(axis, axis, axis, indexing="ij"), -1)
+    centers = grid.view(-1, 3)
+    occupied = torch.ones(centers.shape[0], dtype=torch.bool, device=device)
+    screen = cameras.transform_points_screen(centers[None].expand(len(elev), -1, -1), image_size=(image_size, image_size))
+    for k in range(len(elev)):
+        col = screen[k, :, 0].long().clamp(0, image_size - 1)
+        row = screen[k, :, 1].long().clamp(0, image_size - 1)
+        occupied &= masks[k, row, col]
+
+    # boundary voxels have an empty neighbor
+    grid_occupied = torch.nn.functional.pad(occupied.view(resolution, resolution, resolution).float(), (1,) * 6)
+    inner = -torch.nn.functional.max_pool3d(-grid_occupied[None, None], 3, stride=1)[0, 0] > 0.5
+    boundary = occupied & ~inner.flatten()
+    return wrap(centers[boundary], level)
+
+INITS = {
+    "sphere": sphere,
+    "hull": hull,
+    "visual_hull": visual_hull,
+    "shrinkwrap": shrinkwrap,
+}
+
+def cache_path(target: str, init: str, level: int) -> str:
+    with open(target, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"{digest}-{init}-{level}.obj")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="generate the source mesh of the deformation")
+    parser.add_argument("--init", choices=INITS.keys(), default="sphere")
+    parser.add_argument("--target", default="bunny.obj", help="target mesh of the target-aware initializations")
+    parser.add_argument("--level", type=int, default=4, help="ico_sphere subdivision level, determines the vertex count")
+    parser.add_argument("--out", default="source.obj")
+    parser.add_argument("--force", action="store_true", help="ignore the cache")
+    args = parser.parse_args()
+
+    if args.init == "sphere":
+        m = sphere(None, args.level)
+        save_obj(args.out, m.verts_packed(), m.faces_packed())
+    else:
+        cached = cache_path(args.target, args.init, args.level)
+        if args.force or not os.path.exists(cached):
+            m = INITS[args.init](load_target(args.target), args.level)
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            save_obj(cached, m.verts_packed(), m.faces_packed())
+        else:
+            print(f"cached: {cached}")
+        shutil.copyfile(cached, args.out)
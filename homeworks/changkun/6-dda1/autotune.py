@@ -0,0 +1,140 @@
+# Copyright (c) 2022 LMU Munich Geometry Processing Authors. All rights reserved.
+# Created by Changkun Ou <https://changkun.de>.
+#
+# Use of this source code is governed by a GNU GPLv3 license that can be found
+# in the LICENSE file.
+
+# Autotuning of the coarse-to-fine rasterizer bins.
+#
+# PyTorch3D picks `bin_size` and `max_faces_per_bin` by a heuristic that only
+# looks at the image size. For small meshes, large images or CPU rendering the
+# heuristic is often far from the fastest choice. `raster_settings` benchmarks
+# a few bin configurations once per (face count, camera, device and raster
+# settings) and remembers the winner in a local JSON file, so later runs reuse
+# it without measuring again.
+#
+# A winner is only checked against naive rasterization for the benchmarked
+# mesh and camera. Its face limit of all faces never overflows for meshes with
+# at most as many faces, hence settings are tuned with the densest mesh they
+# render.
+
+import os
+import json
+import hashlib
+import time
+import torch
+from pytorch3d.structures import Meshes
+from pytorch3d.renderer import MeshRasterizer, RasterizationSettings
+
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "autotune.json")
+
+# Candidate bin sizes. None leaves the value to the PyTorch3D heuristic, and a
+# bin size of 0 selects naive rasterization.
+BIN_SIZES = [None, 0, 8, 16, 32, 64, 128]
+
+def candidates(mesh: Meshes) -> list:
+    """Returns (bin_size, max_faces_per_bin) pairs to benchmark. Each bin size
+    is tried with the heuristic face limit and with a limit of all faces, which
+    can never overflow."""
+    F = mesh.faces_packed().shape[0]
+    pairs = [(None, None), (0, None)]
+    for bin_size in BIN_SIZES[2:]:
+        pairs += [(bin_size, None), (bin_size, F)]
+    return pairs
+
+def camera_id(cameras) -> str:
+    """Returns a short hash of the full projection of cameras."""
+    matrix = cameras.get_full_projection_transform().get_matrix()
+    return hashlib.sha1(matrix.detach().cpu().float().numpy().round(6).tobytes()).hexdigest()[:12]
+
+def cache_key(mesh: Meshes, cameras, image_size: int, faces_per_pixel: int, **kwargs) -> str:
+    """Keys on every setting that changes which faces land in which bin: the
+    face count, the camera, the image size and the remaining raster settings
+    such as blur_radius and perspective_correct."""
+    settings = "-".join(f"{k}={kwargs[k]}" for k in sorted(kwargs))
+    return (f"{mesh.faces_packed().shape[0]}-{image_size}-{faces_per_pixel}-{mesh.device.type}"
+            f"-{settings}-{camera_id(cameras)}")
+
+def load_cache(cache_file: str = CACHE_FILE) -> dict:
+    if not os.path.exists(cache_file):
+        return {}
+    with open(cache_file) as f:
+        return json.load(f)
+
+def save_cache(cache: dict, cache_file: str = CACHE_FILE):
+    with open(cache_file, "w") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+
+def _sync(device: torch.device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+def benchmark(mesh: Meshes, cameras, settings: RasterizationSettings, repeat: int = 3) -> float:
+    """Returns the best wall time in seconds of rasterizing mesh with settings."""
+    rasterizer = MeshRasterizer(cameras=cameras, raster_settings=settings)
+    best = float("inf")
+    with torch.no_grad():
+        rasterizer(mesh) # warm up
+        for _ in range(repeat):
+            _sync(mesh.device)
+            t = time.perf_counter()
+            rasterizer(mesh)
+            _sync(mesh.device)
+            best = min(best, time.perf_counter() - t)
+    return best
+
+def autotune(mesh: Meshes, cameras, image_size: int, faces_per_pixel: int,
+             repeat: int = 3, **kwargs) -> dict:
+    """Benchmarks all candidates and returns the fastest one that rasterizes
+    exactly the same faces as naive rasterization. Bins that overflow drop
+    faces silently, hence the comparison against the reference."""
+    def settings(bin_size, max_faces_per_bin):
+        return RasterizationSettings(
+            image_size=image_size,
+            faces_per_pixel=faces_per_pixel,
+            bin_size=bin_size,
+            max_faces_per_bin=max_faces_per_bin,
+            **kwargs,
+        )
+
+    with torch.no_grad():
+        reference = MeshRasterizer(cameras=cameras, raster_settings=settings(0, None))(mesh)
+
+    results = []
+    for bin_size, max_faces_per_bin in candidates(mesh):
+        s = settings(bin_size, max_faces_per_bin)
+        try:
+            with torch.no_grad():
+                fragments = MeshRasterizer(cameras=cameras, raster_settings=s)(mesh)
+            # faces of a pixel are sorted by depth, sort again to ignore ties
+            if not torch.equal(fragments.pix_to_face.sort(-1)[0], reference.pix_to_face.sort(-1)[0]):
+                continue
+            results.append((benchmark(mesh, cameras, s, repeat), bin_size, max_faces_per_bin))
+        except RuntimeError as e:
+            print(f"autotune: skip bin_size={bin_size}: {e}")
+
+    if not results:
+        print("autotune: no candidate matched naive rasterization, using the PyTorch3D heuristic")
+        return {"bin_size": None, "max_faces_per_bin": None, "time": None}
+    t, bin_size, max_faces_per_bin = min(results, key=lambda r: r[0])
+    return {"bin_size": bin_size, "max_faces_per_bin": max_faces_per_bin, "time": t}
+
+def raster_settings(mesh: Meshes, cameras, image_size: int, faces_per_pixel: int,
+                    cache_file: str = CACHE_FILE, **kwargs) -> RasterizationSettings:
+    """Returns RasterizationSettings with the cached best bin configuration,
+    running the autotuner first if the configuration was never measured.
+    mesh must have at least as many faces as every mesh rendered with the
+    settings. Remaining keyword arguments are passed to RasterizationSettings."""
+    cache = load_cache(cache_file)
+    key = cache_key(mesh, cameras, image_size, faces_per_pixel, **kwargs)
+    if key not in cache:
+        cache[key] = autotune(mesh, cameras, image_size, faces_per_pixel, **kwargs)
+        save_cache(cache, cache_file)
+        print(f"autotune: {key} -> {cache[key]}")
+    return RasterizationSettings(
+        image_size=image_size,
+        faces_per_pixel=faces_per_pixel,
+        bin_size=cache[key]["bin_size"],
+        max_faces_per_bin=cache[key]["max_faces_per_bin"],
+        **kwargs,
+    )
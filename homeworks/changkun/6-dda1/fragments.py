@@ -0,0 +1,47 @@
+# Copyright (c) 2022 LMU Munich Geometry Processing Authors. All rights reserved.
+# Created by Changkun Ou <https://changkun.de>.
+#
+# Use of this source code is governed by a GNU GPLv3 license that can be found
+# in the LICENSE file.
+
+# Rasterize once, shade many.
+#
+# Shaders, lights and materials only consume the rasterized Fragments, which
+# depend on nothing but the mesh, the camera and the raster settings. The
+# FragmentCache keeps the Fragments per (mesh, cameras, raster settings), so a
+# lighting study evaluates any number of shader, light and material variants
+# at the cost of shading alone.
+
+from pytorch3d.structures import Meshes
+from pytorch3d.renderer import MeshRasterizer
+
+class FragmentCache():
+    """Caches the output of rasterizer per (mesh, cameras, raster settings).
+
+    Entries are keyed by object identity. A mesh or camera that is modified
+    in place (e.g. by offset_verts_) is not detected; call clear() after such
+    changes.
+    """
+    def __init__(self, rasterizer: MeshRasterizer) -> None:
+        self.rasterizer = rasterizer
+        self.cache = {}
+
+    def fragments(self, mesh: Meshes, cameras=None, raster_settings=None):
+        cameras = cameras or self.rasterizer.cameras
+        settings = raster_settings or self.rasterizer.raster_settings
+        key = (id(mesh), id(cameras), repr(settings))
+        if key not in self.cache:
+            # keep mesh and cameras referenced so that their ids stay unique
+            fragments = self.rasterizer(mesh, cameras=cameras, raster_settings=settings)
+            self.cache[key] = (mesh, cameras, fragments)
+        return self.cache[key][2]
+
+    def shade(self, shader, mesh: Meshes, cameras=None, raster_settings=None, **kwargs):
+        """Shades the cached fragments of mesh with shader. Keyword arguments
+        such as lights or materials are passed to the shader."""
+        cameras = cameras or self.rasterizer.cameras
+        fragments = self.fragments(mesh, cameras, raster_settings)
+        return shader(fragments, mesh, cameras=cameras, **kwargs)
+
+    def clear(self):
+        self.cache = {}
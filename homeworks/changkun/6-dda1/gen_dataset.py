@@ -0,0 +1,151 @@
+# Copyright (c) 2022 LMU Munich Geometry Processing Authors. All rights reserved.
+# Created by Changkun Ou <https://changkun.de>.
+#
+# Use of this source code is governed by a GNU GPLv3 license that can be found
+# in the LICENSE file.
+
+# Offline multi-view dataset generator.
+#
+# Renders randomized views, lights and meshes in batches with the same
+# MeshRenderer/SoftPhongShader setup as main.py and writes them into
+# preallocated memory-mapped .npy arrays plus a manifest.json:
+#
+#   images.npy  uint8   (N, H, W, 3)
+#   R.npy       float32 (N, 3, 3)
+#   T.npy       float32 (N, 3)
+#   lights.npy  float32 (N, 3)
+#   mesh.npy    int32   (N,)      index into manifest["meshes"]
+#
+# Training code streams the arrays with load_dataset without decoding images:
+#
+#   $ python gen_dataset.py --out dataset --n 10000 data/bunny.obj
+#   >>> data = load_dataset("dataset")
+#   >>> data["images"][1234], data["R"][1234]
+
+import os
+import json
+import argparse
+import numpy as np
+import torch
+from pytorch3d.structures import Meshes, join_meshes_as_batch
+from pytorch3d.renderer import (
+    look_at_view_transform,
+    FoVPerspectiveCameras,
+    PointLights,
+    RasterizationSettings,
+    MeshRenderer,
+    MeshRasterizer,
+    SoftPhongShader,
+    BlendParams,
+)
+import texcache
+
+ARRAYS = {
+    "images": (np.uint8,   lambda n, s: (n, s, s, 3)),
+    "R":      (np.float32, lambda n, s: (n, 3, 3)),
+    "T":      (np.float32, lambda n, s: (n, 3)),
+    "lights": (np.float32, lambda n, s: (n, 3)),
+    "mesh":   (np.int32,   lambda n, s: (n,)),
+}
+
+def load_dataset(path: str) -> dict:
+    """Opens a generated dataset read-only. Returns the manifest under
+    "manifest" and every array as a np.memmap under its name."""
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+    data = {"manifest": manifest}
+    for name in manifest["arrays"]:
+        data[name] = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+    return data
+
+def load_uniform(path: str, device: torch.device, image_size: int = None) -> Meshes:
+    # center and rescale to the unit AABB as in main.py
+    mesh   = texcache.load_objs_as_meshes([path], device=device, image_size=image_size)
+    verts  = mesh.verts_packed()
+    center = verts.mean(0)
+    scale  = max((verts - center).abs().max(0)[0])
+    mesh.offset_verts_(-center)
+    mesh.scale_verts_((1.0 / float(scale)))
+    return mesh
+
+def generate(mesh_paths: list, out: str, n: int, batch: int, image_size: int,
+             faces_per_pixel: int, seed: int, device: torch.device):
+    meshes = [load_uniform(p, device, image_size) for p in mesh_paths]
+    os.makedirs(out, exist_ok=True)
+    arrays = {
+        name: np.lib.format.open_memmap(
+            os.path.join(out, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape(n, image_size)
+        )
+        for name, (dtype, shape) in ARRAYS.items()
+    }
+
+    renderer = MeshRenderer(
+        rasterizer=MeshRasterizer(
+            raster_settings=RasterizationSettings(
+                image_size=image_size,
+                blur_radius=0.0,
+                faces_per_pixel=faces_per_pixel,
+            ),
+        ),
+        shader=SoftPhongShader(
+            device=device,
+            blend_params=BlendParams(background_color=(0,0,0)),
+        )
+    )
+
+    g = torch.Generator().manual_seed(seed)
+    def uniform(lo, hi, size):
+        return lo + (hi - lo) * torch.rand(size, generator=g)
+
+    for i in range(0, n, batch):
+        b = min(batch, n - i)
+        # random meshes, views on a shell around the unit cube, and lights
+        index  = torch.randint(len(meshes), (b,), generator=g)
+        R, T   = look_at_view_transform(uniform(1.8, 3.0, b), uniform(-30, 60, b), uniform(0, 360, b))
+        lights = torch.nn.functional.normalize(torch.randn(b, 3, generator=g), dim=1) * uniform(2.0, 4.0, (b, 1))
+
+        cameras = FoVPerspectiveCameras(znear=0.01, zfar=1000, R=R, T=T, device=device)
+        with torch.no_grad():
+            images = renderer(
+                join_meshes_as_batch([meshes[k] for k in index.tolist()]),
+                cameras=cameras,
+                lights=PointLights(device=device, location=lights.to(device)),
+            )
+        arrays["images"][i:i+b] = (images[..., :3].clamp(0, 1) * 255).round().byte().cpu().numpy()
+        arrays["R"][i:i+b]      = R.numpy()
+        arrays["T"][i:i+b]      = T.numpy()
+        arrays["lights"][i:i+b] = lights.numpy()
+        arrays["mesh"][i:i+b]   = index.numpy()
+        print(f"[{i+b}/{n}]")
+
+    for a in arrays.values():
+        a.flush()
+    manifest = {
+        "n": n,
+        "image_size": image_size,
+        "faces_per_pixel": faces_per_pixel,
+        "seed": seed,
+        "meshes": mesh_paths,
+        "camera": {"type": "FoVPerspectiveCameras", "znear": 0.01, "zfar": 1000, "fov": 60},
+        "arrays": {
+            name: {"dtype": np.dtype(a.dtype).name, "shape": list(a.shape)}
+            for name, a in arrays.items()
+        },
+    }
+    with open(os.path.join(out, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="render a multi-view dataset into memory-mapped arrays")
+    parser.add_argument("meshes", nargs="*", default=[os.path.join("./data", "bunny.obj")])
+    parser.add_argument("--out", default="dataset")
+    parser.add_argument("--n", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--image-size", type=int, default=128)
+    parser.add_argument("--faces-per-pixel", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    generate(args.meshes, args.out, args.n, args.batch, args.image_size,
+             args.faces_per_pixel, args.seed, device)
@@ -6,7 +6,6 @@
 
 import os
 import torch
-from pytorch3d.io import load_objs_as_meshes
 from pytorch3d.renderer import (
     look_at_view_transform,
     FoVPerspectiveCameras,
@@ -15,26 +14,53 @@ from pytorch3d.renderer import (
     MeshRenderer,
     MeshRasterizer,
     SoftPhongShader,
+    HardFlatShader,
     BlendParams,
+    Materials,
 )
 import matplotlib.pyplot as plt
+import autotune
+import turntable
+import tiled
+import fragments
+import lod
+import texcache
+import profiling
+from torch.profiler import record_function
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 torch.cuda.set_device(device)
 
-mesh    = load_objs_as_meshes([os.path.join("./data", "bunny.obj")], device=device)
+# number of turntable views to render in addition to render.png, 0 disables it
+TURNTABLE_VIEWS = 0
+# size of an additional tiled high-resolution render (e.g. 4096 or 8192), 0
+# disables it. Peak memory is bounded by TILE_SIZE instead of the output size.
+TILED_IMAGE_SIZE = 0
+TILE_SIZE = 1024
+# compare a 2 x 2 tiled render with a render at once, with soft blending so
+# that the scaling of blur_radius and sigma per tile is covered
+TILED_CHECK = False
+# render shader, light and material variants against one rasterization
+SHADING_STUDY = False
+# profile repeated renders split into rasterization and shading, written to
+# profile/trace.json and profile/operators.txt
+PROFILE = False
+
+mesh    = texcache.load_objs_as_meshes([os.path.join("./data", "bunny.obj")], device=device)
 verts  = mesh.verts_packed()
 center = verts.mean(0)
 scale  = max((verts - center).abs().max(0)[0])
 mesh.offset_verts_(-center)
 mesh.scale_verts_((1.0 / float(scale)))
+lods = lod.LOD(mesh)
 
 R, T = look_at_view_transform(2, 30, 60)
 camera = FoVPerspectiveCameras(znear=0.01, zfar=1000, R=R, T=T, device=device)
 renderer = MeshRenderer(
     rasterizer=MeshRasterizer(
         cameras=camera,
-        raster_settings=RasterizationSettings(
+        raster_settings=autotune.raster_settings(
+            mesh, camera,
             image_size=1024,
             blur_radius=0.0,
             faces_per_pixel=1,
@@ -47,9 +73,64 @@ renderer = MeshRenderer(
         blend_params=BlendParams(background_color=(0,0,0)),
     )
 )
-target_images = renderer(mesh)
+target_images = renderer(lods.select(camera, 1024))
 plt.imshow(target_images.cpu().numpy()[0, ..., :3])
 plt.grid("off")
 plt.axis("off")
 plt.gcf().set_facecolor("black")
-plt.savefig('render.png')
\ No newline at end of file
+plt.savefig('render.png')
+
+if TURNTABLE_VIEWS > 0:
+    images = turntable.render_turntable(renderer, lods.select(camera, 1024), TURNTABLE_VIEWS, dist=2, elev=30)
+    turntable.save_turntable(images, "turntable", "turntable.png")
+
+if TILED_IMAGE_SIZE > 0:
+    image = tiled.render_tiled(renderer, mesh, camera, TILED_IMAGE_SIZE, TILE_SIZE)
+    plt.imsave(f"render_{TILED_IMAGE_SIZE}.png", image[..., :3].numpy())
+
+if TILED_CHECK:
+    soft = MeshRenderer(
+        rasterizer=MeshRasterizer(
+            cameras=camera,
+            raster_settings=RasterizationSettings(image_size=512, blur_radius=1e-4, faces_per_pixel=10),
+        ),
+        shader=SoftPhongShader(
+            device=device,
+            cameras=camera,
+            lights=PointLights(device=device, location=[[1.0, 1.0, 1.0]]),
+            blend_params=BlendParams(sigma=1e-4, background_color=(0,0,0)),
+        )
+    )
+    print(f"tiled vs. untiled: max difference {tiled.check(soft, mesh, camera, 512, 256)}/255")
+
+if SHADING_STUDY:
+    cache = fragments.FragmentCache(renderer.rasterizer)
+    blend = BlendParams(background_color=(0,0,0))
+    variants = {
+        "phong": (SoftPhongShader(device=device, cameras=camera, blend_params=blend), dict(
+            lights=PointLights(device=device, location=[[1.0, 1.0, 1.0]]),
+        )),
+        "flat": (HardFlatShader(device=device, cameras=camera, blend_params=blend), dict(
+            lights=PointLights(device=device, location=[[1.0, 1.0, 1.0]]),
+        )),
+        "shiny": (SoftPhongShader(device=device, cameras=camera, blend_params=blend), dict(
+            lights=PointLights(device=device, location=[[2.0, 3.0, 0.0]]),
+            materials=Materials(device=device, specular_color=[[1.0, 1.0, 1.0]], shininess=1000.0),
+        )),
+    }
+    with torch.no_grad():
+        for name, (shader, kwargs) in variants.items():
+            image = cache.shade(shader, mesh, **kwargs)
+            plt.imsave(f"render_{name}.png", image[0, ..., :3].clamp(0, 1).cpu().numpy())
+
+if PROFILE:
+    prof = profiling.Profiler(warmup=1, active=3)
+    prof.start()
+    with torch.no_grad():
+        for _ in range(5):
+            with record_function("rasterize"):
+                frags = renderer.rasterizer(mesh)
+            with record_function("shade"):
+                renderer.shader(frags, mesh)
+            prof.step()
+    prof.stop()
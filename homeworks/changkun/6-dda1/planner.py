@@ -0,0 +1,111 @@
+# Copyright (c) 2022 LMU Munich Geometry Processing Authors. All rights reserved.
+# Created by Changkun Ou <https://changkun.de>.
+#
+# Use of this source code is governed by a GNU GPLv3 license that can be found
+# in the LICENSE file.
+
+# Memory budget planner.
+#
+# Estimates the peak memory of one optimization step from the render
+# settings, the number of views, the number of sampled surface points and the
+# mesh sizes, and picks the highest quality settings that fit into a budget.
+# The estimates are coarse per-element byte counts of the buffers PyTorch3D
+# allocates; report() compares them with the measured peak of a real step.
+
+import sys
+import resource
+import itertools
+import torch
+
+# Bytes per pixel and face slot: fragments (pix_to_face int64, zbuf, dists,
+# 3 barycentric coordinates) and the shader's per-fragment temporaries
+# (about six float32 RGB tensors for colors, normals and lighting terms).
+FRAGMENT_BYTES = 8 + 4 + 4 + 3 * 4
+SHADER_BYTES   = 6 * 3 * 4
+# Bytes per sampled point: the points and their normals in both clouds, the
+# sampling weights and the nearest neighbour indices and distances.
+POINT_BYTES    = 2 * (2 * 3 * 4 + 4 + 8 + 4)
+# Bytes per vertex and per face of the mesh terms (edges, normals, the
+# uniform Laplacian) including their gradients.
+VERTEX_BYTES   = 64 * 4
+FACE_BYTES     = 48 * 4
+
+IMAGE_SIZES     = [512, 256, 192, 128, 96, 64]
+FACES_PER_PIXEL = [10, 5, 3, 1]
+VIEWS           = [8, 4, 2, 1]
+SAMPLE_POINTS   = [10000, 5000, 2000, 1000]
+
+def raster_bytes(n_views: int, image_size: int, faces_per_pixel: int) -> int:
+    """Bytes of rasterizing and shading n_views images at once."""
+    return n_views * image_size ** 2 * faces_per_pixel * (FRAGMENT_BYTES + SHADER_BYTES)
+
+def estimate(meshes: list, image_size: int, faces_per_pixel: int, n_views: int,
+             n_points: int = 0, chunk: int = 0, checkpoint: bool = False) -> dict:
+    """Returns the estimated bytes per stage of one forward and backward step
+    rendering the first mesh and the target (second mesh, if any)."""
+    chunk = chunk or n_views
+    V = sum(m.verts_packed().shape[0] for m in meshes)
+    F = sum(m.faces_packed().shape[0] for m in meshes)
+    # without checkpointing autograd holds the buffers of all views until
+    # backward, with it only one chunk is alive at a time
+    held = chunk if checkpoint else n_views
+    # held activations plus the gradients of the chunk under backward
+    parts = {
+        "render":  raster_bytes(held, image_size, faces_per_pixel) + raster_bytes(chunk, image_size, faces_per_pixel),
+        "chamfer": n_points * POINT_BYTES,
+        "graph":   V * VERTEX_BYTES + F * FACE_BYTES,
+    }
+    parts["total"] = sum(parts.values())
+    return parts
+
+def plan(budget: int, meshes: list, sample_points: bool = True, chunk: int = 0,
+         checkpoint: bool = False) -> dict:
+    """Returns the settings of highest quality whose estimated peak fits into
+    budget bytes. Quality ranks supervised pixels (views x image size^2)
+    first, then faces per pixel, then sampled points."""
+    samples = SAMPLE_POINTS if sample_points else [0]
+    candidates = sorted(
+        itertools.product(IMAGE_SIZES, FACES_PER_PIXEL, VIEWS, samples),
+        key=lambda c: (c[2] * c[0] ** 2, c[1], c[3]),
+        reverse=True,
+    )
+    for image_size, faces_per_pixel, n_views, n_points in candidates:
+        parts = estimate(meshes, image_size, faces_per_pixel, n_views, n_points, chunk, checkpoint)
+        if parts["total"] <= budget:
+            return {
+                "image_size": image_size,
+                "faces_per_pixel": faces_per_pixel,
+                "n_views": n_views,
+                "n_points": n_points,
+                "estimate": parts,
+            }
+    raise ValueError(f"no settings fit into {budget / 2**20:.0f} MiB")
+
+def reset_peak_memory(device: torch.device):
+    if device.type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+
+def peak_memory(device: torch.device) -> int:
+    """Returns the peak memory in bytes: allocated tensors on CUDA, the
+    resident set size of the process (not resettable) on the CPU."""
+    if device.type == "cuda":
+        return torch.cuda.max_memory_allocated(device)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+def baseline(device: torch.device) -> int:
+    """Resets the peak statistics and returns the memory in use. The peak
+    afterwards minus the baseline is what the following steps allocated. On
+    the CPU this is the growth of the process' maximum resident set size,
+    which is exact only if the steps reach a new peak, as the first
+    optimization step usually does."""
+    if device.type == "cuda":
+        reset_peak_memory(device)
+        return torch.cuda.memory_allocated(device)
+    return peak_memory(device)
+
+def report(settings: dict, measured: int) -> str:
+    estimated = settings["estimate"]["total"]
+    parts = ", ".join(f"{k} {v / 2**20:.0f}" for k, v in settings["estimate"].items() if k != "total")
+    return (f"planned {estimated / 2**20:.0f} MiB ({parts}), measured {measured / 2**20:.0f} MiB, "
+            f"ratio {measured / max(estimated, 1):.2f}")
@@ -0,0 +1,62 @@
+# Copyright (c) 2022 LMU Munich Geometry Processing Authors. All rights reserved.
+# Created by Changkun Ou <https://changkun.de>.
+#
+# Use of this source code is governed by a GNU GPLv3 license that can be found
+# in the LICENSE file.
+
+# Windowed torch.profiler capture.
+#
+# A Profiler skips `wait` iterations, warms up for `warmup` iterations and
+# records the following `active` iterations with input shapes and memory.
+# The capture is exported as a Chrome trace (open it in chrome://tracing or
+# https://ui.perfetto.dev) and as a table of the top operators. Stages of the
+# loop are labeled with torch.profiler.record_function ranges, which cost
+# nothing while the profiler is disabled.
+
+import os
+import torch
+from torch.profiler import profile, schedule, ProfilerActivity
+
+class Profiler():
+    def __init__(self, enabled: bool = True, wait: int = 0, warmup: int = 10, active: int = 5,
+                 out_dir: str = "profile", row_limit: int = 30) -> None:
+        self.enabled = enabled
+        self.out_dir = out_dir
+        self.row_limit = row_limit
+        self.prof = None
+        if not enabled:
+            return
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        self.sort_by = "self_cuda_time_total" if torch.cuda.is_available() else "self_cpu_time_total"
+        self.prof = profile(
+            activities=activities,
+            schedule=schedule(wait=wait, warmup=warmup, active=active, repeat=1),
+            on_trace_ready=self.export,
+            record_shapes=True,
+            profile_memory=True,
+        )
+
+    def export(self, prof: profile):
+        os.makedirs(self.out_dir, exist_ok=True)
+        trace = os.path.join(self.out_dir, "trace.json")
+        prof.export_chrome_trace(trace)
+        table = prof.key_averages().table(sort_by=self.sort_by, row_limit=self.row_limit)
+        with open(os.path.join(self.out_dir, "operators.txt"), "w") as f:
+            f.write(table)
+        print(table)
+        print(f"profile: chrome trace written to {trace}")
+
+    def start(self):
+        if self.enabled:
+            self.prof.start()
+
+    def step(self):
+        """Marks the end of an iteration."""
+        if self.enabled:
+            self.prof.step()
+
+    def stop(self):
+        if self.enabled:
+            self.prof.stop()
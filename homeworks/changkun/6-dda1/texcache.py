@@ -0,0 +1,98 @@
+# Copyright (c) 2022 LMU Munich Geometry Processing Authors. All rights reserved.
+# Created by Changkun Ou <https://changkun.de>.
+#
+# Use of this source code is governed by a GNU GPLv3 license that can be found
+# in the LICENSE file.
+
+# Decoded texture and material cache.
+#
+# pytorch3d's load_objs_as_meshes parses the .mtl file and decodes the texture
+# image on every call. load_objs_as_meshes in this module loads the geometry
+# only and takes the texture map from a cache of decoded, device-ready maps
+# keyed by the hash of the image file. Repeated loads and multi-mesh scenes
+# share a single map in memory, and precomputed mip levels serve low
+# resolution renders.
+
+import os
+import math
+import hashlib
+import numpy as np
+import torch
+from PIL import Image
+from pytorch3d.io import load_obj
+from pytorch3d.structures import Meshes
+from pytorch3d.renderer import TexturesUV
+
+_hashes = {}    # (path, mtime) -> sha1 of the file
+_materials = {} # (obj path, mtime) -> texture image path or None
+_maps = {}      # (sha1, device, mip level) -> (H, W, 3) texture map
+
+def file_hash(path: str) -> str:
+    key = (path, os.path.getmtime(path))
+    if key not in _hashes:
+        with open(path, "rb") as f:
+            _hashes[key] = hashlib.sha1(f.read()).hexdigest()
+    return _hashes[key]
+
+def texture_path(obj_path: str) -> str:
+    """Returns the diffuse texture (map_Kd) of the first material library of
+    obj_path, or None."""
+    key = (obj_path, os.path.getmtime(obj_path))
+    if key not in _materials:
+        _materials[key] = None
+        base = os.path.dirname(obj_path)
+        with open(obj_path) as f:
+            mtllib = next((l.split(maxsplit=1)[1].strip() for l in f if l.startswith("mtllib ")), None)
+        if mtllib is not None and os.path.exists(os.path.join(base, mtllib)):
+            with open(os.path.join(base, mtllib)) as f:
+                for l in f:
+                    if l.strip().startswith("map_Kd "):
+                        _materials[key] = os.path.join(base, l.split(maxsplit=1)[1].strip())
+                        break
+    return _materials[key]
+
+def texture_map(path: str, device: torch.device, mip_level: int = 0) -> torch.Tensor:
+    """Returns the decoded (H, W, 3) float texture map of path on device,
+    downsampled mip_level times by 2x2 averaging."""
+    key = (file_hash(path), str(device), mip_level)
+    if key not in _maps:
+        if mip_level == 0:
+            image = np.asarray(Image.open(path).convert("RGB"), dtype=np.float32) / 255.0
+            _maps[key] = torch.from_numpy(image).to(device)
+        else:
+            finer = texture_map(path, device, mip_level - 1)
+            coarser = torch.nn.functional.avg_pool2d(finer.permute(2, 0, 1)[None], 2)
+            _maps[key] = coarser[0].permute(1, 2, 0).contiguous()
+    return _maps[key]
+
+def mip_level(texture_size: int, image_size: int) -> int:
+    """Returns the coarsest mip level that is still at least as large as the
+    rendered image."""
+    if image_size is None or image_size >= texture_size:
+        return 0
+    return int(math.floor(math.log2(texture_size / image_size)))
+
+def load_objs_as_meshes(files: list, device: torch.device, image_size: int = None) -> Meshes:
+    """Drop-in replacement of pytorch3d.io.load_objs_as_meshes that shares
+    decoded texture maps. If image_size is given, a mip level that matches the
+    render resolution is used."""
+    verts, faces, verts_uvs, faces_uvs, maps = [], [], [], [], []
+    for f in files:
+        v, fs, aux = load_obj(f, load_textures=False, device=device)
+        verts.append(v)
+        faces.append(fs.verts_idx)
+        tex = texture_path(f)
+        if tex is None or aux.verts_uvs is None:
+            continue
+        full = texture_map(tex, device)
+        maps.append(texture_map(tex, device, mip_level(max(full.shape[:2]), image_size)))
+        verts_uvs.append(aux.verts_uvs)
+        faces_uvs.append(fs.textures_idx)
+
+    textures = None
+    if len(maps) == len(files):
+        # a single shared map is expanded without copying it per mesh
+        if all(m is maps[0] for m in maps):
+            maps = maps[0][None].expand(len(files), -1, -1, -1)
+        textures = TexturesUV(maps=maps, faces_uvs=faces_uvs, verts_uvs=verts_uvs)
+    return Meshes(verts=verts, faces=faces, textures=textures)
@@ -0,0 +1,92 @@
+# Copyright (c) 2022 LMU Munich Geometry Processing Authors. All rights reserved.
+# Created by Changkun Ou <https://changkun.de>.
+#
+# Use of this source code is governed by a GNU GPLv3 license that can be found
+# in the LICENSE file.
+
+# Tiled high-resolution rendering.
+#
+# Fragment buffers grow with H x W x faces_per_pixel, so a 4K or 8K render does
+# not fit into memory at once. The image plane is split into square tiles; each
+# tile gets a camera whose projection maps exactly the tile's part of the NDC
+# square onto [-1, 1], is rasterized and shaded on its own, and is copied into
+# the output image on the CPU. Peak memory is bounded by the tile size.
+
+import torch
+from pytorch3d.structures import Meshes
+from pytorch3d.renderer import BlendParams, FoVPerspectiveCameras, MeshRenderer, RasterizationSettings
+import autotune
+
+def tile_camera(camera: FoVPerspectiveCameras, tx: int, ty: int, n: int) -> FoVPerspectiveCameras:
+    """Returns a camera that sees tile (tx, ty) of an n x n tiling of the image
+    of camera. PyTorch3D's NDC has +X pointing left and +Y pointing up, hence
+    tile (0, 0) is centered at (1 - 1/n, 1 - 1/n)."""
+    K = camera.compute_projection_matrix(
+        camera.znear, camera.zfar, camera.fov, camera.aspect_ratio, camera.degrees
+    )
+    cx = 1 - (2 * tx + 1) / n
+    cy = 1 - (2 * ty + 1) / n
+    # scale around the tile center in clip space: x' = n * (x - cx * w)
+    A = torch.tensor([
+        [n, 0, 0, -n * cx],
+        [0, n, 0, -n * cy],
+        [0, 0, 1, 0],
+        [0, 0, 0, 1],
+    ], dtype=K.dtype, device=K.device)
+    return FoVPerspectiveCameras(
+        znear=camera.znear, zfar=camera.zfar, fov=camera.fov,
+        R=camera.R, T=camera.T, K=A @ K, device=camera.device,
+    )
+
+def render_tiled(renderer: MeshRenderer, mesh: Meshes, camera: FoVPerspectiveCameras,
+                 image_size: int, tile_size: int = 1024, **kwargs) -> torch.Tensor:
+    """Renders mesh from camera at image_size x image_size pixels, tile by
+    tile, and returns the stitched (H, W, 4) uint8 image on the CPU."""
+    if image_size % tile_size != 0:
+        raise ValueError(f"image size {image_size} is not a multiple of tile size {tile_size}")
+    n = image_size // tile_size
+    rs = renderer.rasterizer.raster_settings
+    # A tile stretches NDC distances by n. blur_radius and the sigma of the
+    # soft blending are compared with squared NDC distances, so both scale by
+    # n**2 to keep the footprint in pixels of the untiled render. The bins are
+    # tuned with the zoomed camera of a tile at the image center, not with the
+    # camera of the whole image.
+    settings = autotune.raster_settings(
+        mesh, tile_camera(camera, n // 2, n // 2, n),
+        image_size=tile_size,
+        faces_per_pixel=rs.faces_per_pixel,
+        blur_radius=rs.blur_radius * n ** 2,
+        perspective_correct=rs.perspective_correct,
+    )
+    blend = kwargs.pop("blend_params", getattr(renderer.shader, "blend_params", None))
+    if blend is not None:
+        kwargs["blend_params"] = BlendParams(
+            sigma=blend.sigma * n ** 2, gamma=blend.gamma, background_color=blend.background_color,
+        )
+
+    out = torch.zeros(image_size, image_size, 4, dtype=torch.uint8)
+    for ty in range(n):
+        for tx in range(n):
+            with torch.no_grad():
+                img = renderer(mesh, cameras=tile_camera(camera, tx, ty, n), raster_settings=settings, **kwargs)
+            tile = (img[0].clamp(0, 1) * 255).round().byte().cpu()
+            out[ty * tile_size:(ty + 1) * tile_size, tx * tile_size:(tx + 1) * tile_size] = tile
+    return out
+
+def check(renderer: MeshRenderer, mesh: Meshes, camera: FoVPerspectiveCameras,
+          image_size: int = 512, tile_size: int = 256, **kwargs) -> int:
+    """Renders mesh tiled and at once at image_size and returns the largest
+    difference of a color channel between both, in 8 bit steps."""
+    tiled = render_tiled(renderer, mesh, camera, image_size, tile_size, **kwargs)
+    rs = renderer.rasterizer.raster_settings
+    settings = RasterizationSettings(
+        image_size=image_size,
+        faces_per_pixel=rs.faces_per_pixel,
+        blur_radius=rs.blur_radius,
+        perspective_correct=rs.perspective_correct,
+        bin_size=0,
+    )
+    with torch.no_grad():
+        img = renderer(mesh, cameras=camera, raster_settings=settings, **kwargs)
+    whole = (img[0].clamp(0, 1) * 255).round().byte().cpu()
+    return int((tiled.int() - whole.int()).abs().max())
@@ -0,0 +1,83 @@
+# Copyright (c) 2022 LMU Munich Geometry Processing Authors. All rights reserved.
+# Created by Changkun Ou <https://changkun.de>.
+#
+# Use of this source code is governed by a GNU GPLv3 license that can be found
+# in the LICENSE file.
+
+# Batched turntable rendering.
+#
+# All camera poses are created by a single batched look_at_view_transform and
+# rendered in as few batched renderer calls as fit into the memory budget.
+# Frames and the contact sheet are written directly from the image tensors.
+
+import os
+import math
+import torch
+from pytorch3d.structures import Meshes
+from pytorch3d.renderer import (
+    look_at_view_transform,
+    FoVPerspectiveCameras,
+    MeshRenderer,
+)
+import matplotlib.pyplot as plt
+import planner
+
+def views_per_chunk(renderer: MeshRenderer, budget: int) -> int:
+    """Estimates how many views fit into budget bytes in one renderer call."""
+    settings = renderer.rasterizer.raster_settings
+    image_size = settings.image_size if isinstance(settings.image_size, int) else max(settings.image_size)
+    return max(1, budget // planner.raster_bytes(1, image_size, settings.faces_per_pixel))
+
+def _out_of_memory(e: RuntimeError) -> bool:
+    return "out of memory" in str(e) or "not enough memory" in str(e)
+
+def render_turntable(renderer: MeshRenderer, mesh: Meshes, n_views: int,
+                     dist: float = 2, elev: float = 30, chunk: int = None,
+                     budget: int = 2**30, **kwargs) -> torch.Tensor:
+    """Renders n_views evenly spaced azimuths around mesh and returns the
+    (n_views, H, W, 4) images on the CPU. Chunks are sized by budget and are
+    halved whenever a chunk does not fit into memory."""
+    azim = torch.linspace(0, 360, n_views + 1)[:-1]
+    R, T = look_at_view_transform(dist, elev, azim, device=mesh.device)
+    template = renderer.rasterizer.cameras
+    chunk = chunk or views_per_chunk(renderer, budget)
+
+    images = []
+    i = 0
+    while i < n_views:
+        j = min(n_views, i + chunk)
+        cameras = FoVPerspectiveCameras(
+            znear=template.znear, zfar=template.zfar, fov=template.fov,
+            R=R[i:j], T=T[i:j], device=mesh.device,
+        )
+        try:
+            with torch.no_grad():
+                images.append(renderer(mesh.extend(j - i), cameras=cameras, **kwargs).cpu())
+        except RuntimeError as e:
+            if not _out_of_memory(e) or chunk == 1:
+                raise
+            chunk = max(1, chunk // 2)
+            if mesh.device.type == "cuda":
+                torch.cuda.empty_cache()
+            print(f"turntable: out of memory, retry with {chunk} views per chunk")
+            continue
+        i = j
+    return torch.cat(images)
+
+def contact_sheet(images: torch.Tensor, cols: int = None) -> torch.Tensor:
+    """Tiles (N, H, W, C) images into a single (rows*H, cols*W, C) image."""
+    N, H, W, C = images.shape
+    cols = cols or math.ceil(math.sqrt(N))
+    rows = math.ceil(N / cols)
+    padded = torch.zeros(rows * cols, H, W, C, dtype=images.dtype)
+    padded[:N] = images
+    return padded.view(rows, cols, H, W, C).permute(0, 2, 1, 3, 4).reshape(rows * H, cols * W, C)
+
+def save_image(fname: str, img: torch.Tensor):
+    plt.imsave(fname, img[..., :3].clamp(0, 1).numpy())
+
+def save_turntable(images: torch.Tensor, out_dir: str, sheet: str, cols: int = None):
+    os.makedirs(out_dir, exist_ok=True)
+    for i, img in enumerate(images):
+        save_image(os.path.join(out_dir, f"frame_{i:03d}.png"), img)
+    save_image(sheet, contact_sheet(images, cols))
@@ -0,0 +1,203 @@
+# Copyright (c) 2022 LMU Munich Geometry Processing Authors. All rights reserved.
+# Created by Changkun Ou <https://changkun.de>.
+#
+# Use of this source code is governed by a GNU GPLv3 license that can be found
+# in the LICENSE file.
+
+# Persistent local render worker.
+#
+# Importing torch and pytorch3d, loading the textured bunny and building a
+# renderer take seconds, while the render itself takes milliseconds. The
+# worker pays these costs once, keeps meshes and renderers warm, and serves
+# render jobs over a local Unix socket:
+#
+#   $ python worker.py serve &
+#   $ python worker.py render --mesh data/bunny.obj --azim 90 --out side.png
+#   $ python worker.py stop
+#
+# The client side only imports the standard library.
+#
+# The socket and a random authentication key live in a directory only the
+# current user can access ($XDG_RUNTIME_DIR, or a private directory in the
+# temporary directory). multiprocessing.connection unpickles every message,
+# so both sides authenticate with the key before anything is received.
+
+import os
+import sys
+import stat
+import time
+import argparse
+import tempfile
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+def runtime_dir() -> str:
+    """Returns a directory owned by the current user with mode 0700."""
+    path = os.environ.get("XDG_RUNTIME_DIR")
+    if not path:
+        path = os.path.join(tempfile.gettempdir(), f"gp-render-worker-{os.getuid()}")
+        os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) & 0o077:
+        raise RuntimeError(f"{path} must be a directory of the current user with mode 0700")
+    return path
+
+def address() -> str:
+    return os.path.join(runtime_dir(), "gp-render-worker.sock")
+
+def key_path() -> str:
+    return os.path.join(runtime_dir(), "gp-render-worker.key")
+
+def new_authkey() -> bytes:
+    """Creates the key of a new worker, readable only by the current user."""
+    key = os.urandom(32)
+    fd = os.open(key_path(), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+def authkey() -> bytes:
+    with open(key_path(), "rb") as f:
+        return f.read()
+
+class Worker():
+    def __init__(self) -> None:
+        import torch
+        self.torch = torch
+        self.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+        self.meshes = {}
+        self.renderers = {}
+
+    def mesh(self, path: str):
+        path = os.path.abspath(path)
+        if path not in self.meshes:
+            from gen_dataset import load_uniform
+            self.meshes[path] = load_uniform(path, self.device)
+        return self.meshes[path]
+
+    def renderer(self, mesh_path: str, image_size: int, faces_per_pixel: int,
+                 blur_radius: float, shader: str):
+        key = (os.path.abspath(mesh_path), image_size, faces_per_pixel, blur_radius, shader)
+        if key not in self.renderers:
+            from pytorch3d.renderer import (
+                MeshRenderer,
+                MeshRasterizer,
+                SoftPhongShader,
+                HardFlatShader,
+                BlendParams,
+                FoVPerspectiveCameras,
+                look_at_view_transform,
+            )
+            import autotune
+            R, T = look_at_view_transform(2, 30, 60)
+            camera = FoVPerspectiveCameras(znear=0.01, zfar=1000, R=R, T=T, device=self.device)
+            shaders = {"phong": SoftPhongShader, "flat": HardFlatShader}
+            self.renderers[key] = MeshRenderer(
+                rasterizer=MeshRasterizer(
+                    cameras=camera,
+                    raster_settings=autotune.raster_settings(
+                        self.mesh(mesh_path), camera,
+                        image_size=image_size,
+                        blur_radius=blur_radius,
+                        faces_per_pixel=faces_per_pixel,
+                    ),
+                ),
+                shader=shaders[shader](
+                    device=self.device,
+                    cameras=camera,
+                    blend_params=BlendParams(background_color=(0,0,0)),
+                )
+            )
+        return self.renderers[key]
+
+    def render(self, job: dict) -> dict:
+        from pytorch3d.renderer import FoVPerspectiveCameras, PointLights, look_at_view_transform
+        import matplotlib.pyplot as plt
+
+        t = time.perf_counter()
+        mesh = self.mesh(job["mesh"])
+        renderer = self.renderer(job["mesh"], job["image_size"], job["faces_per_pixel"],
+                                 job["blur_radius"], job["shader"])
+        R, T = look_at_view_transform(job["dist"], job["elev"], job["azim"])
+        camera = FoVPerspectiveCameras(znear=0.01, zfar=1000, R=R, T=T, device=self.device)
+        lights = PointLights(device=self.device, location=[job["light"]])
+        with self.torch.no_grad():
+            images = renderer(mesh, cameras=camera, lights=lights)
+        plt.imsave(job["output"], images[0, ..., :3].clamp(0, 1).cpu().numpy())
+        return {"ok": True, "output": job["output"], "seconds": time.perf_counter() - t}
+
+def serve(address: str):
+    worker = Worker()
+    if os.path.exists(address):
+        os.remove(address)
+    with Listener(address, family="AF_UNIX", authkey=new_authkey()) as listener:
+        print(f"render worker listening on {address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, EOFError, OSError) as e:
+                print(f"rejected connection: {e!r}")
+                continue
+            with conn:
+                try:
+                    job = conn.recv()
+                    if not isinstance(job, dict):
+                        conn.send({"ok": False, "error": f"job is a {type(job).__name__}, not a dict"})
+                        continue
+                    if job.get("stop"):
+                        conn.send({"ok": True})
+                        break
+                    try:
+                        result = worker.render(job)
+                    except Exception as e:
+                        result = {"ok": False, "error": repr(e)}
+                    conn.send(result)
+                except (EOFError, OSError) as e:
+                    print(f"dropped connection: {e!r}")
+
+def request(address: str, job: dict) -> dict:
+    with Client(address, family="AF_UNIX", authkey=authkey()) as conn:
+        conn.send(job)
+        return conn.recv()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="persistent render worker and its client")
+    parser.add_argument("--address", default=None, help="socket path, defaults to one in the private runtime directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("serve")
+    sub.add_parser("stop")
+    r = sub.add_parser("render")
+    r.add_argument("--mesh", default=os.path.join("./data", "bunny.obj"))
+    r.add_argument("--out", default="render.png")
+    r.add_argument("--dist", type=float, default=2)
+    r.add_argument("--elev", type=float, default=30)
+    r.add_argument("--azim", type=float, default=60)
+    r.add_argument("--image-size", type=int, default=1024)
+    r.add_argument("--faces-per-pixel", type=int, default=1)
+    r.add_argument("--blur-radius", type=float, default=0.0)
+    r.add_argument("--shader", choices=["phong", "flat"], default="phong")
+    r.add_argument("--light", type=float, nargs=3, default=[1.0, 1.0, 1.0])
+    args = parser.parse_args()
+    if args.address is None:
+        args.address = address()
+
+    if args.command == "serve":
+        serve(args.address)
+    elif args.command == "stop":
+        request(args.address, {"stop": True})
+    else:
+        result = request(args.address, {
+            "mesh": os.path.abspath(args.mesh),
+            "output": os.path.abspath(args.out),
+            "dist": args.dist,
+            "elev": args.elev,
+            "azim": args.azim,
+            "image_size": args.image_size,
+            "faces_per_pixel": args.faces_per_pixel,
+            "blur_radius": args.blur_radius,
+            "shader": args.shader,
+            "light": args.light,
+        })
+        if not result["ok"]:
+            sys.exit(result["error"])
+        print(f"{result['output']}: {result['seconds'] * 1000:.1f} ms")
@@ -0,0 +1,87 @@
+# Copyright (c) 2022 LMU Munich Geometry Processing Authors. All rights reserved.
+# Created by Changkun Ou <https://changkun.de>.
+#
+# Use of this source code is governed by a GNU GPLv3 license that can be found
+# in the LICENSE file.
+
+# Geometry-only render loss.
+#
+# For shape fitting only coverage and depth matter, so the render loss does
+# not need lighting and shading. GeometryLoss rasterizes a soft silhouette and
+# the depth of the nearest face. Each target view is rendered once, together
+# with a distance transform of its silhouette. Coverage outside the target is
+# penalized by its distance to the target, which keeps the gradients
+# informative far away from the silhouette boundary.
+
+import math
+import torch
+import precision
+from pytorch3d.structures import Meshes
+from pytorch3d.renderer import (
+    MeshRasterizer,
+    RasterizationSettings,
+    SoftSilhouetteShader,
+    BlendParams,
+)
+
+def distance_transform(mask: torch.Tensor, chunk: int = 4096) -> torch.Tensor:
+    """Returns the euclidean distance in pixels of every pixel of the (H, W)
+    boolean mask to the nearest pixel inside the mask."""
+    H, W = mask.shape
+    if not mask.any():
+        return torch.full((H, W), float(max(H, W)), device=mask.device)
+    # only inside pixels next to an outside pixel can be nearest
+    padded = torch.nn.functional.pad(mask[None, None].float(), (1, 1, 1, 1))
+    eroded = -torch.nn.functional.max_pool2d(-padded, 3, stride=1)[0, 0] > 0.5
+    boundary = torch.nonzero(mask & ~eroded).float()
+    ys, xs = torch.meshgrid(torch.arange(H, device=mask.device), torch.arange(W, device=mask.device), indexing="ij")
+    pixels = torch.stack([ys.flatten(), xs.flatten()], 1).float()
+    dist = torch.cat([torch.cdist(p, boundary).min(1)[0] for p in pixels.split(chunk)])
+    return dist.view(H, W) * (~mask)
+
+class GeometryLoss():
+    def __init__(self, camera, image_size: int = 128, faces_per_pixel: int = 10,
+                 sigma: float = 1e-4, w_silhouette: float = 1.0,
+                 w_distance: float = 1.0, w_depth: float = 1.0) -> None:
+        self.camera = camera
+        self.rasterizer = MeshRasterizer(
+            cameras=camera,
+            raster_settings=RasterizationSettings(
+                image_size=image_size,
+                blur_radius=math.log(1.0 / 1e-4 - 1.0) * sigma,
+                faces_per_pixel=faces_per_pixel,
+                perspective_correct=False,
+            ),
+        )
+        self.shader = SoftSilhouetteShader(blend_params=BlendParams(sigma=sigma, gamma=1e-4))
+        self.image_size = image_size
+        self.weights = {"silhouette": w_silhouette, "distance": w_distance, "depth": w_depth}
+        self.targets = {}
+
+    def render(self, mesh: Meshes, camera=None):
+        """Returns the (N, H, W) soft silhouette and the depth of the nearest
+        face, which is -1 where no face covers the pixel."""
+        camera = camera or self.camera
+        fragments = precision.rasterize(self.rasterizer, mesh, cameras=camera)
+        silhouette = self.shader(fragments, mesh, cameras=camera)[..., 3]
+        return silhouette, fragments.zbuf[..., 0]
+
+    def target(self, mesh: Meshes, key, camera=None):
+        """Returns the cached silhouette, depth and normalized distance
+        transform of mesh seen from the view identified by key."""
+        if key not in self.targets:
+            with torch.no_grad():
+                silhouette, depth = self.render(mesh, camera)
+                distance = torch.stack([distance_transform(d >= 0) for d in depth]) / self.image_size
+            self.targets[key] = (silhouette, depth, distance)
+        return self.targets[key]
+
+    def __call__(self, mesh: Meshes, target: Meshes, key=0, camera=None) -> dict:
+        silhouette, depth = self.render(mesh, camera)
+        t_silhouette, t_depth, t_distance = self.target(target, key, camera)
+        both = ((depth >= 0) & (t_depth >= 0)).float()
+        return {
+            "silhouette": self.weights["silhouette"] * ((silhouette - t_silhouette) ** 2).mean(),
+            "distance":   self.weights["distance"] * (silhouette * t_distance).mean(),
+            "depth":      self.weights["depth"] * ((depth - t_depth).abs() * both).sum() / both.sum().clamp(min=1),
+        }
@@ -5,16 +5,20 @@
 # in the LICENSE file.
 
 import os
+import sys
+import time
 import torch
 import numpy as np
 import pytorch3d
 from pytorch3d.io import load_obj, save_obj
 from pytorch3d.loss import (
+    chamfer_distance,
     mesh_edge_loss,
     mesh_laplacian_smoothing,
     mesh_normal_consistency,
 )
 from pytorch3d.structures import Meshes
+from pytorch3d.ops import sample_points_from_meshes
 from pytorch3d.renderer import (
     look_at_view_transform,
     FoVPerspectiveCameras,
@@ -27,22 +31,64 @@ from pytorch3d.renderer import (
     Textures
 )
 import matplotlib.pyplot as plt
+# the helpers shared with the rendering homework live in ../6-dda1
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "6-dda1"))
+import autotune
+import geometry_loss
+import multiview
+import planner
+import profiling
+import precision
+import regularizers
+from torch.profiler import record_function
 
 debug  = True
+# "rgb" compares shaded renderings, "geometry" only silhouette and depth
+RENDER_LOSS = "rgb"
+# views of the rgb render loss, rendered VIEW_CHUNK at a time (0: all at once).
+# CHECKPOINT recomputes each chunk during backward instead of storing it.
+N_VIEWS    = 1
+VIEW_CHUNK = 0
+CHECKPOINT = False
+# memory budget in bytes (e.g. 16 * 2**30), if set the planner overrides
+# IMAGE_SIZE, FACES_PER_PIXEL and N_VIEWS with the best settings that fit.
+MEMORY_BUDGET   = 0
+IMAGE_SIZE      = 128
+FACES_PER_PIXEL = 10
+# capture PROFILE_ACTIVE iterations after PROFILE_WARMUP iterations with
+# torch.profiler, written to profile/trace.json and profile/operators.txt
+PROFILE        = False
+PROFILE_WARMUP = 10
+PROFILE_ACTIVE = 5
+# shade and compare the renderings under autocast (bfloat16 on the CPU,
+# float16 on CUDA). PRECISION_REPORT first fits REPORT_ITERATIONS iterations
+# in float32 and with AMP and compares their chamfer distance and time.
+AMP               = False
+PRECISION_REPORT  = False
+REPORT_ITERATIONS = 500
+# fit REPORT_ITERATIONS iterations from each of these source meshes (e.g.
+# written by gen_source_mesh.py --init hull --out data/hull.obj) and print
+# their chamfer distance every 100 iterations, and when each reaches the
+# final chamfer distance of the first one
+INIT_REPORT = []
+# compute the edge, normal and laplacian terms from the topology precomputed
+# once and capture them with torch.compile (eager if compilation fails)
+COMPILE = False
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 print(f"torch: {torch.__version__}, torch3d: {pytorch3d.__version__}, device: ", device)
 
-def load_and_uniform(model_path: str) -> Meshes:
+def load_and_uniform(model_path: str, normalize: bool = True) -> Meshes:
     # load target mesh
     verts, faces, _ = load_obj(model_path)
     verts = verts.to(device)
     faces = faces.verts_idx.to(device)
 
     # rescale to the unit AABB and construct the target mesh.
-    T = verts.mean(0)
-    verts = verts - T
-    S = max(verts.abs().max(0)[0])
-    verts = verts / S
+    if normalize:
+        T = verts.mean(0)
+        verts = verts - T
+        S = max(verts.abs().max(0)[0])
+        verts = verts / S
     return Meshes(
         verts=[verts], faces=[faces],
         textures = Textures(verts_rgb=torch.tensor([0, 0.5, 1]).repeat(verts.shape[0], 1)[None].to(device))
@@ -56,18 +102,25 @@ def save_fig(fname: str, img: torch.Tensor):
     plt.savefig(fname)
 
 class Render():
-    def __init__(self) -> None:
+    def __init__(self, mesh: Meshes = None, image_size: int = 128, faces_per_pixel: int = 10) -> None:
         R, T = look_at_view_transform(2, 30, 60)
         self.camera = FoVPerspectiveCameras(znear=0.01, zfar=1000, R=R, T=T, device=device)
+        self.image_size = image_size
+        settings = dict(
+            perspective_correct=False,
+            image_size=image_size,
+            blur_radius=0.001,
+            faces_per_pixel=faces_per_pixel,
+        )
+        # use the autotuned bin configuration if the densest mesh to render is given
+        if mesh is not None:
+            raster_settings = autotune.raster_settings(mesh, self.camera, **settings)
+        else:
+            raster_settings = RasterizationSettings(**settings)
         self.renderer = MeshRenderer(
         rasterizer=MeshRasterizer(
             cameras=self.camera,
-            raster_settings=RasterizationSettings(
-                perspective_correct=False,
-                image_size=128,
-                blur_radius=0.001,
-                faces_per_pixel=10,
-            ),
+            raster_settings=raster_settings,
         ),
         shader=HardFlatShader(
             device=device,
@@ -78,13 +131,32 @@ class Render():
     ).to(device)
 
     def render(self, mesh: Meshes, camera: FoVPerspectiveCameras = None) -> torch.Tensor:
-        return self.renderer(mesh, cameras=camera or self.camera)
+        # same as self.renderer(), but keeps the rasterization in float32
+        # inside an autocast region
+        camera = camera or self.camera
+        fragments = precision.rasterize(self.renderer.rasterizer, mesh, cameras=camera)
+        return self.renderer.shader(fragments, mesh, cameras=camera)
 
-# load source mesh
-src_mesh = load_and_uniform(os.path.join(".", "data", "source.obj"))
+# load source mesh. It is already in the normalized frame of the target: the
+# unit ico_sphere, or an initialization of gen_source_mesh.py placed onto the
+# target, which normalizing it by its own mean and extent would move away.
+src_mesh = load_and_uniform(os.path.join(".", "data", "source.obj"), normalize=False)
 dst_mesh = load_and_uniform(os.path.join(".", "data", "bunny.obj"))
 
-r = Render()
+if MEMORY_BUDGET > 0:
+    plan = planner.plan(MEMORY_BUDGET, [src_mesh, dst_mesh], sample_points=False, chunk=VIEW_CHUNK, checkpoint=CHECKPOINT)
+    IMAGE_SIZE, FACES_PER_PIXEL, N_VIEWS = plan["image_size"], plan["faces_per_pixel"], plan["n_views"]
+    print(f"planned settings: {plan}")
+
+# the deformed meshes have the faces of src_mesh, the target those of dst_mesh
+r = Render(max(src_mesh, dst_mesh, key=lambda m: m.faces_packed().shape[0]),
+           image_size=IMAGE_SIZE, faces_per_pixel=FACES_PER_PIXEL)
+geometry = geometry_loss.GeometryLoss(r.camera, image_size=r.image_size)
+views = multiview.MultiViewLoss(
+    r, dst_mesh,
+    n_views=N_VIEWS, chunk=VIEW_CHUNK, use_checkpoint=CHECKPOINT,
+)
+memory_baseline = planner.baseline(device)
 
 losses = {
     "render":    {"weight": 1.0, "values": []},
@@ -93,33 +165,120 @@ losses = {
     "laplacian": {"weight": 1.0, "values": []},
 }
 
-deformation = torch.full(src_mesh.verts_packed().shape, 0.0, device=device, requires_grad=True)
-optimizer   = torch.optim.SGD([deformation], lr=1, momentum=0.9)
-mse         = torch.nn.MSELoss()
-N           = 10000
-
-for i in range(N):
-    optimizer.zero_grad()
-
-    deformed_mesh = src_mesh.offset_verts(deformation)
-    loss = {k: torch.tensor(0.0, device=device) for k in losses}
-    loss["edge"]      = mesh_edge_loss(deformed_mesh)
-    loss["normal"]    = mesh_normal_consistency(deformed_mesh)
-    loss["laplacian"] = mesh_laplacian_smoothing(deformed_mesh, method="uniform")
-    loss["render"]    = mse(r.render(deformed_mesh), r.render(dst_mesh))
-
-    sum_loss = torch.tensor(0.0, device=device)
-    for k, l in loss.items():
-        sum_loss += l * losses[k]["weight"]
-        losses[k]["values"].append(float(l.detach().cpu()))
-
-    sum_loss.backward()
-    optimizer.step()
-
-    if i % 100 == 0:
-        print(f'[{i}/{N}]: loss - {sum_loss}')
-        if debug:
-            save_fig(f'out/render_{i}.png', r.render(deformed_mesh))
+N = 10000
+src_verts = src_mesh.verts_packed()
+topology  = regularizers.Regularizers(src_mesh.faces_packed(), src_verts.shape[0], compiled=COMPILE)
+
+def fit(n: int, amp: bool = False, profile: bool = False, log: bool = True,
+        source: Meshes = None, trace: list = None):
+    """Fits a fresh deformation of source (src_mesh by default) in n
+    iterations and returns the deformed mesh and the seconds per iteration,
+    without the first iteration which includes compilation and warmup. With
+    amp the render loss runs under autocast, the deformation and the optimizer
+    state stay in float32. If trace is given, (iteration, chamfer distance)
+    is appended to it every 100 iterations."""
+    src = src_mesh if source is None else source
+    src_verts = src.verts_packed()
+    reg = topology if source is None else regularizers.Regularizers(src.faces_packed(), src_verts.shape[0], compiled=COMPILE)
+    deformation = torch.full(src_verts.shape, 0.0, device=device, requires_grad=True)
+    optimizer   = torch.optim.SGD([deformation], lr=1, momentum=0.9)
+    scaler      = precision.grad_scaler(device, enabled=amp)
+    for k in losses:
+        losses[k]["values"] = []
+
+    prof = profiling.Profiler(enabled=profile, warmup=PROFILE_WARMUP, active=PROFILE_ACTIVE)
+    prof.start()
+    for i in range(n):
+        if i == 1:
+            if device.type == "cuda":
+                torch.cuda.synchronize(device)
+            start = time.perf_counter()
+        optimizer.zero_grad()
+
+        with record_function("deform"):
+            deformed_mesh = src.offset_verts(deformation)
+        if COMPILE:
+            with record_function("loss/regularizers"):
+                loss = reg(src_verts + deformation)
+        else:
+            loss = {}
+            with record_function("loss/edge"):
+                loss["edge"]      = mesh_edge_loss(deformed_mesh)
+            with record_function("loss/normal"):
+                loss["normal"]    = mesh_normal_consistency(deformed_mesh)
+            with record_function("loss/laplacian"):
+                loss["laplacian"] = mesh_laplacian_smoothing(deformed_mesh, method="uniform")
+        with record_function("render"), precision.autocast(device, enabled=amp):
+            if RENDER_LOSS == "geometry":
+                loss["render"] = sum(geometry(deformed_mesh, dst_mesh).values())
+            else:
+                loss["render"] = views(deformed_mesh)
+        loss["render"] = loss["render"].float()
+
+        sum_loss = sum(l * losses[k]["weight"] for k, l in loss.items())
+        # a single device to host copy of all terms
+        for k, v in zip(loss, torch.stack(list(loss.values())).detach().cpu().tolist()):
+            losses[k]["values"].append(v)
+
+        with record_function("backward"):
+            scaler.scale(sum_loss).backward()
+        with record_function("step"):
+            scaler.step(optimizer)
+            scaler.update()
+        prof.step()
+
+        if trace is not None and i % 100 == 0:
+            with torch.no_grad():
+                trace.append((i, chamfer(deformed_mesh.detach())))
+        if not log:
+            continue
+        if i == 0 and MEMORY_BUDGET > 0:
+            print(planner.report(plan, planner.peak_memory(device) - memory_baseline))
+        if i % 100 == 0:
+            print(f'[{i}/{n}]: loss - {sum_loss}, peak memory - {planner.peak_memory(device) / 2**20:.0f} MiB')
+            if debug:
+                save_fig(f'out/render_{i}.png', r.render(deformed_mesh))
+
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    step_time = (time.perf_counter() - start) / (n - 1) if n > 1 else float("nan")
+    prof.stop()
+    return src.offset_verts(deformation.detach()), step_time
+
+def chamfer(mesh: Meshes, n_points: int = 10000) -> float:
+    # the same samples for every call, without reseeding the rest of the run
+    with torch.random.fork_rng(devices=[device] if device.type == "cuda" else []):
+        torch.manual_seed(0)
+        x = sample_points_from_meshes(mesh, n_points)
+        y = sample_points_from_meshes(dst_mesh, n_points)
+    return float(chamfer_distance(x, y)[0])
+
+if PRECISION_REPORT:
+    results = {}
+    for amp in [False, True]:
+        name = str(precision.dtype(device)).split(".")[-1] if amp else "float32"
+        mesh, step_time = fit(REPORT_ITERATIONS, amp=amp, log=False)
+        results[name] = (chamfer(mesh), step_time)
+    base_chamfer, base_time = results["float32"]
+    for name, (cd, step_time) in results.items():
+        print(f"{name:>8}: chamfer {cd:.6f} ({cd / base_chamfer:.3f}x), "
+              f"{step_time * 1000:.1f} ms/iteration ({base_time / step_time:.2f}x speedup)")
+
+if INIT_REPORT:
+    traces = {}
+    for path in INIT_REPORT:
+        traces[path] = []
+        mesh, _ = fit(REPORT_ITERATIONS, source=load_and_uniform(path, normalize=False), log=False, trace=traces[path])
+        traces[path].append((REPORT_ITERATIONS, chamfer(mesh)))
+    base = traces[INIT_REPORT[0]][-1][1]
+    for path, trace in traces.items():
+        reached = next((i for i, cd in trace if cd <= base), None)
+        print(f"{path}: " + ", ".join(f"{i}: {cd:.5f}" for i, cd in trace)
+              + f"; reaches {base:.5f} at iteration {reached if reached is not None else '>' + str(REPORT_ITERATIONS)}")
+
+deformed_mesh, step_time = fit(N, amp=AMP, profile=PROFILE)
+print(f"step time {step_time * 1000:.1f} ms/iteration ({'compiled' if COMPILE else 'eager'}), "
+      f"chamfer distance {chamfer(deformed_mesh):.6f}")
 
 save_fig(f'render.png', r.render(deformed_mesh))
 save_fig(f'target.png', r.render(dst_mesh))
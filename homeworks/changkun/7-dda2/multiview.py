@@ -0,0 +1,60 @@
+# Copyright (c) 2022 LMU Munich Geometry Processing Authors. All rights reserved.
+# Created by Changkun Ou <https://changkun.de>.
+#
+# Use of this source code is governed by a GNU GPLv3 license that can be found
+# in the LICENSE file.
+
+# Multi-view render loss with optional activation checkpointing.
+#
+# Autograd keeps the (N, H, W, faces_per_pixel) fragment buffers of every view
+# until backward, so memory grows linearly with the number of views and the
+# image size. MultiViewLoss renders the views in chunks. With checkpointing
+# enabled, only the vertex positions are saved for each chunk and its
+# rasterization and shading are recomputed during backward: peak memory is
+# then bounded by one chunk at the cost of rendering every view twice.
+
+import torch
+from torch.utils.checkpoint import checkpoint
+from pytorch3d.structures import Meshes
+from pytorch3d.renderer import look_at_view_transform, FoVPerspectiveCameras
+
+class MultiViewLoss():
+    def __init__(self, render, target: Meshes, n_views: int = 1, chunk: int = 0,
+                 use_checkpoint: bool = False, dist: float = 2, elev: float = 30,
+                 azim: float = 60) -> None:
+        """Compares renderings of n_views azimuths around the mesh, starting at
+        azim, with renderings of target. chunk views are rendered at once, all
+        views if chunk is 0."""
+        self.render = render
+        self.n_views = n_views
+        self.use_checkpoint = use_checkpoint
+        chunk = chunk or n_views
+
+        R, T = look_at_view_transform(dist, elev, azim + torch.linspace(0, 360, n_views + 1)[:-1])
+        template = render.camera
+        self.cameras, self.targets = [], []
+        for i in range(0, n_views, chunk):
+            j = min(n_views, i + chunk)
+            camera = FoVPerspectiveCameras(
+                znear=template.znear, zfar=template.zfar, fov=template.fov,
+                R=R[i:j], T=T[i:j], device=template.device,
+            )
+            self.cameras.append(camera)
+            with torch.no_grad():
+                self.targets.append(render.render(target.extend(j - i), camera))
+
+    def chunk_loss(self, verts: torch.Tensor, faces: torch.Tensor, textures, k: int) -> torch.Tensor:
+        n = len(self.cameras[k])
+        mesh = Meshes(verts=[verts], faces=[faces], textures=textures).extend(n)
+        image = self.render.render(mesh, self.cameras[k])
+        return torch.nn.functional.mse_loss(image, self.targets[k]) * n / self.n_views
+
+    def __call__(self, mesh: Meshes) -> torch.Tensor:
+        verts, faces = mesh.verts_packed(), mesh.faces_packed()
+        total = 0
+        for k in range(len(self.cameras)):
+            if self.use_checkpoint:
+                total = total + checkpoint(self.chunk_loss, verts, faces, mesh.textures, k, use_reentrant=False)
+            else:
+                total = total + self.chunk_loss(verts, faces, mesh.textures, k)
+        return total
@@ -0,0 +1,34 @@
+# Copyright (c) 2022 LMU Munich Geometry Processing Authors. All rights reserved.
+# Created by Changkun Ou <https://changkun.de>.
+#
+# Use of this source code is governed by a GNU GPLv3 license that can be found
+# in the LICENSE file.
+
+# Mixed precision helpers.
+#
+# Shading and the image loss may run under autocast, bfloat16 on the CPU and
+# float16 on CUDA. Rasterization always runs in float32: the rasterizer
+# kernels only accept float32 vertices, and the depth test and barycentric
+# coordinates need the full precision. Parameters and optimizer state are not
+# touched by autocast and stay in float32. float16 gradients may underflow,
+# hence they are scaled by a GradScaler, which is a no-op for bfloat16.
+
+import torch
+
+def dtype(device: torch.device) -> torch.dtype:
+    """Returns the reduced precision type used on device."""
+    return torch.float16 if device.type == "cuda" else torch.bfloat16
+
+def autocast(device: torch.device, enabled: bool = True):
+    return torch.autocast(device_type=device.type, dtype=dtype(device), enabled=enabled)
+
+def rasterize(rasterizer, mesh, **kwargs):
+    """Runs rasterizer in float32, also inside an autocast region."""
+    with torch.autocast(device_type=mesh.device.type, enabled=False):
+        return rasterizer(mesh, **kwargs)
+
+def grad_scaler(device: torch.device, enabled: bool = True):
+    enabled = enabled and dtype(device) == torch.float16
+    if hasattr(torch.amp, "GradScaler"):
+        return torch.amp.GradScaler("cuda", enabled=enabled)
+    return torch.cuda.amp.GradScaler(enabled=enabled)
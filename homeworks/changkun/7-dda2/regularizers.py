@@ -0,0 +1,99 @@
+# Copyright (c) 2022 LMU Munich Geometry Processing Authors. All rights reserved.
+# Created by Changkun Ou <https://changkun.de>.
+#
+# Use of this source code is governed by a GNU GPLv3 license that can be found
+# in the LICENSE file.
+
+# Mesh regularizers for a fixed topology.
+#
+# mesh_edge_loss, mesh_normal_consistency and mesh_laplacian_smoothing rebuild
+# the edges, the face pairs and the Laplacian of a Meshes object in every
+# iteration, although the deformation never changes the topology. Regularizers
+# derives them once from the faces, after which the three terms are a few
+# gathers on the vertex positions. Such a plain tensor function is captured as
+# a single graph by torch.compile, which removes the per-iteration Python and
+# dispatcher overhead of the terms and fuses their elementwise kernels.
+
+import itertools
+import numpy as np
+import torch
+
+def maybe_compile(fn, enabled: bool = True):
+    """Returns fn compiled by torch.compile. If torch.compile is unavailable
+    or fails, fn runs eagerly instead. The first call also runs the compiled
+    backward on detached copies of the inputs, since the backward graph is
+    only compiled when backward() is first called on its outputs."""
+    if not enabled:
+        return fn
+    if not hasattr(torch, "compile"):
+        print("compile: torch.compile is not available, running eagerly")
+        return fn
+    compiled = torch.compile(fn, dynamic=False)
+    checked = False
+    def check(*args, **kwargs):
+        args = [a.detach().clone().requires_grad_(a.is_floating_point()) if torch.is_tensor(a) else a for a in args]
+        out = compiled(*args, **kwargs)
+        outs = out.values() if isinstance(out, dict) else out if isinstance(out, (list, tuple)) else [out]
+        outs = [o.sum() for o in outs if torch.is_tensor(o) and o.requires_grad]
+        if outs:
+            torch.autograd.backward(outs)
+    def call(*args, **kwargs):
+        nonlocal compiled, checked
+        try:
+            if not checked:
+                check(*args, **kwargs)
+                checked = True
+            return compiled(*args, **kwargs)
+        except Exception as e:
+            if compiled is fn:
+                raise
+            print(f"compile: {type(e).__name__}: {e}, running eagerly")
+            compiled = fn
+            return fn(*args, **kwargs)
+    return call
+
+class Regularizers():
+    def __init__(self, faces: torch.Tensor, n_verts: int, compiled: bool = False) -> None:
+        """Precomputes the topology of the (F, 3) faces over n_verts
+        vertices. The losses match the PyTorch3D ones of a single mesh with
+        the uniform Laplacian."""
+        device = faces.device
+        F = faces.cpu().numpy()
+        # every face contributes its three edges and their opposite vertices
+        half = np.concatenate([F[:, [0, 1, 2]], F[:, [1, 2, 0]], F[:, [2, 0, 1]]])
+        edges, inverse = np.unique(np.sort(half[:, :2], axis=1), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        # all pairs of faces sharing an edge
+        order = np.argsort(inverse, kind="stable")
+        splits = np.flatnonzero(np.diff(inverse[order])) + 1
+        pairs = []
+        for group in np.split(order, splits):
+            for a, b in itertools.combinations(group, 2):
+                pairs.append((edges[inverse[a]][0], edges[inverse[a]][1], half[a, 2], half[b, 2]))
+        pairs = np.array(pairs, dtype=np.int64).reshape(-1, 4)
+
+        self.edges = torch.from_numpy(edges.astype(np.int64)).to(device)
+        self.pairs = torch.from_numpy(pairs).to(device)
+        # the uniform Laplacian averages the neighbors of every vertex
+        both = torch.cat([self.edges, self.edges.flip(1)])
+        self.src, self.dst = both[:, 0], both[:, 1]
+        degree = torch.bincount(self.src, minlength=n_verts).float()
+        self.inv_degree = torch.where(degree > 0, 1 / degree.clamp(min=1), degree)[:, None]
+        self.forward = maybe_compile(self.losses, compiled)
+
+    def losses(self, verts: torch.Tensor) -> dict:
+        v0, v1 = verts[self.edges[:, 0]], verts[self.edges[:, 1]]
+        edge = ((v0 - v1) ** 2).sum(1).mean()
+
+        p0, p1, p2, p3 = (verts[self.pairs[:, k]] for k in range(4))
+        n0 = torch.cross(p1 - p0, p2 - p0, dim=1)
+        n1 = -torch.cross(p1 - p0, p3 - p0, dim=1)
+        normal = (1 - torch.cosine_similarity(n0, n1, dim=1)).mean()
+
+        neighbors = torch.zeros_like(verts).index_add_(0, self.src, verts[self.dst])
+        laplacian = (neighbors * self.inv_degree - verts).norm(dim=1).mean()
+        return {"edge": edge, "normal": normal, "laplacian": laplacian}
+
+    def __call__(self, verts: torch.Tensor) -> dict:
+        return self.forward(verts)
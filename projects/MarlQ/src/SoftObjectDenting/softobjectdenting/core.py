@@ -0,0 +1,556 @@
+"""Copyright (c) 2021 LMU Munich Geometry Processing Authors. All rights reserved.
+Created by Marcel Quanz.
+
+Use of this source code is governed by a GNU GPLv3 license that can be found
+in the LICENSE file."""
+
+# The denting algorithm on plain NumPy arrays, independent of bpy. Meshes are
+# given in object local coordinates together with their 4x4 world matrix, the
+# Blender operator only reads the objects into Meshes and writes the result
+# back into the shape key.
+
+import time
+import hashlib
+from contextlib import contextmanager
+from math import inf, sqrt
+import numpy as np
+
+from .spatial import VoxelOccupancy, PointGrid, diameter
+from . import falloff
+
+# A triangle mesh in object local coordinates
+class Mesh:
+    def __init__(self, co, tris, edges=None, matrix=None):
+        self.co = np.asarray(co, dtype=np.float64).reshape(-1, 3)
+        self.tris = np.asarray(tris, dtype=np.int64).reshape(-1, 3)
+        if edges is None:
+            edges = np.sort(np.concatenate([self.tris[:, [0, 1]], self.tris[:, [1, 2]], self.tris[:, [2, 0]]]), axis=1)
+            edges = np.unique(edges, axis=0)
+        self.edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        self.matrix = np.eye(4) if matrix is None else np.array(matrix, dtype=np.float64)
+
+# Records the duration of a stage into timings, if given
+@contextmanager
+def stage(timings, name):
+    start = time.perf_counter()
+    yield
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+# Hash of the contents of the arrays
+def fingerprint(*arrays):
+    h = hashlib.sha1()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        h.update(str((array.dtype, array.shape)).encode())
+        h.update(array.tobytes())
+    return h.hexdigest()
+
+# Keeps the last result of every stage of deform together with the key of
+# its inputs (fingerprints of the meshes and the parameters the stage uses).
+# Running deform again with the same cache only recomputes the stages whose
+# key changed, e.g. only the distribution when just the sink-in changed.
+class Cache:
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, name, key, compute):
+        entry = self.entries.get(name)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        value = compute()
+        self.entries[name] = (key, value)
+        return value
+
+    def clear(self):
+        self.entries.clear()
+
+# Applies a 4x4 matrix to an (n, 3) array of points
+def transformPoints(matrix, points):
+    m = np.asarray(matrix, dtype=np.float64)
+    return points @ m[:3, :3].T + m[:3, 3]
+
+# Computes the vertex normals of the (n, 3) coordinates, weighting the normals
+# of the adjacent triangles by their angle at the vertex like Blender does
+def vertexNormals(co, tris):
+    a, b, c = co[tris[:, 0]], co[tris[:, 1]], co[tris[:, 2]]
+    face = np.cross(b - a, c - a)
+    face /= np.maximum(np.linalg.norm(face, axis=1), 1e-12)[:, None]
+    normals = np.zeros_like(co)
+    for i, (p, q, r) in enumerate([(a, b, c), (b, c, a), (c, a, b)]):
+        u, v = q - p, r - p
+        cos = (u * v).sum(1) / np.maximum(np.linalg.norm(u, axis=1) * np.linalg.norm(v, axis=1), 1e-12)
+        np.add.at(normals, tris[:, i], face * np.arccos(np.clip(cos, -1, 1))[:, None])
+    return normals / np.maximum(np.linalg.norm(normals, axis=1), 1e-12)[:, None]
+
+# Moeller-Trumbore intersection of rays (origins o, directions d) with
+# triangles (corner a, edges e1 and e2), all broadcast against each other.
+# Returns the hit distances along the directions, inf where a ray misses the
+# triangle or hits it behind the origin. Hits up to eps (in barycentric
+# coordinates) outside of the triangle are accepted.
+def _rayTriangle(o, d, a, e1, e2, eps=0.0):
+    p = np.cross(d, e2)
+    det = (e1 * p).sum(-1)
+    parallel = np.abs(det) < 1e-12
+    inv = 1.0 / np.where(parallel, 1.0, det)
+    tv = o - a
+    u = (tv * p).sum(-1) * inv
+    q = np.cross(tv, e1)
+    v = (d * q).sum(-1) * inv
+    t = (e2 * q).sum(-1) * inv
+    hit = ~parallel & (u >= -eps) & (v >= -eps) & (u + v <= 1 + eps) & (t > 1e-9)
+    return np.where(hit, t, np.inf)
+
+# Intersects rays with all triangles in chunks of rays. Yields the slice of
+# rays and their (rays, triangles) hit distances.
+def _intersections(co, tris, origins, directions, pairs=1 << 20):
+    a = co[tris[:, 0]]
+    e1 = co[tris[:, 1]] - a
+    e2 = co[tris[:, 2]] - a
+    directions = np.broadcast_to(directions, origins.shape)
+    step = max(1, pairs // max(len(tris), 1))
+    for s in range(0, len(origins), step):
+        o = origins[s:s + step, None, :]
+        d = directions[s:s + step, None, :]
+        yield slice(s, s + len(o)), _rayTriangle(o, d, a[None], e1[None], e2[None])
+
+# Casts rays against the mesh like Object.ray_cast. Returns whether each ray
+# hits, and the location, face normal and triangle index of the closest hit.
+def rayCast(co, tris, origins, directions):
+    origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+    directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+    hit = np.zeros(len(origins), dtype=bool)
+    location = np.zeros((len(origins), 3))
+    index = np.full(len(origins), -1, dtype=np.int64)
+    if len(tris) == 0:
+        return hit, location, np.zeros((len(origins), 3)), index
+    for rays, t in _intersections(co, tris, origins, directions):
+        i = t.argmin(1)
+        t = t[np.arange(len(i)), i]
+        hit[rays] = np.isfinite(t)
+        index[rays] = np.where(hit[rays], i, -1)
+        location[rays] = origins[rays] + np.where(hit[rays], t, 0)[:, None] * directions[rays]
+    face = np.cross(co[tris[:, 1]] - co[tris[:, 0]], co[tris[:, 2]] - co[tris[:, 0]])
+    face /= np.maximum(np.linalg.norm(face, axis=1), 1e-12)[:, None]
+    normal = np.where(hit[:, None], face[np.maximum(index, 0)], 0)
+    return hit, location, normal, index
+
+# Determines whether points are inside the mesh by ray casting: the rays
+# along all three axes have to cross the surface an odd number of times.
+# For every axis, the triangles are binned into a grid across the rays, so
+# that each ray is only tested against the triangles of its own cell.
+# A ray through an edge or a vertex hits all triangles sharing it. Like
+# the ray_cast loop, which continued behind every hit, hits at the same
+# distance along a ray are counted once.
+def insideExact(co, tris, points, pairs=1 << 20):
+    if len(points) == 0 or len(tris) == 0:
+        return np.zeros(len(points), dtype=bool)
+    tolerance = 1e-9 * max(np.ptp(co, axis=0).max(), 1e-12)
+    a = co[tris[:, 0]]
+    e1 = co[tris[:, 1]] - a
+    e2 = co[tris[:, 2]] - a
+    corners = co[tris]
+    lo, hi = corners.min(1), corners.max(1)
+    inside = np.ones(len(points), dtype=bool)
+    for axis in range(3):
+        uv = [k for k in range(3) if k != axis]
+        cell = max((hi[:, uv] - lo[:, uv]).mean(), 1e-12)
+        origin = lo[:, uv].min(0)
+        c0 = np.floor((lo[:, uv] - origin) / cell).astype(np.int64)
+        c1 = np.floor((hi[:, uv] - origin) / cell).astype(np.int64)
+        shape = c1.max(0) + 1
+        span = c1 - c0
+        bins, keys = [], []
+        for du in range(span[:, 0].max() + 1):
+            for dv in range(span[:, 1].max() + 1):
+                m = np.flatnonzero((du <= span[:, 0]) & (dv <= span[:, 1]))
+                bins.append(m)
+                keys.append((c0[m, 0] + du) * shape[1] + c0[m, 1] + dv)
+        bins, keys = np.concatenate(bins), np.concatenate(keys)
+        order = np.argsort(keys, kind="stable")
+        bins, keys = bins[order], keys[order]
+
+        # the (point, triangle) pairs sharing a cell
+        pc = np.floor((points[:, uv] - origin) / cell).astype(np.int64)
+        valid = ((pc >= 0) & (pc < shape)).all(1)
+        pkey = pc[:, 0] * shape[1] + pc[:, 1]
+        start = np.searchsorted(keys, pkey, "left")
+        counts = np.where(valid, np.searchsorted(keys, pkey, "right") - start, 0)
+        ends = np.cumsum(counts)
+        splits = np.searchsorted(ends, np.arange(pairs, ends[-1], pairs), "right")
+        crossings = np.zeros(len(points), dtype=np.int64)
+        for lo_p, hi_p in zip(np.concatenate([[0], splits]), np.concatenate([splits, [len(points)]])):
+            n = counts[lo_p:hi_p]
+            pt = np.repeat(np.arange(lo_p, hi_p), n)
+            offset = np.arange(len(pt)) - np.repeat(np.cumsum(n) - n, n)
+            tri = bins[np.repeat(start[lo_p:hi_p], n) + offset]
+            t = _rayTriangle(points[pt], np.eye(3)[axis], a[tri], e1[tri], e2[tri], eps=1e-9)
+            hit = np.isfinite(t)
+            pt, t = pt[hit], t[hit]
+            order = np.lexsort((t, pt))
+            pt, t = pt[order], t[order]
+            distinct = np.ones(len(pt), dtype=bool)
+            distinct[1:] = (pt[1:] != pt[:-1]) | (t[1:] - t[:-1] > tolerance)
+            crossings += np.bincount(pt[distinct], minlength=len(points))
+        inside &= crossings % 2 == 1
+    return inside
+
+# Classifies all points as inside or outside of the mesh (both in the same
+# coordinates). A voxel occupancy of the mesh decides all points away from
+# the surface, only the points close to it are checked by ray casting.
+# An occupancy built before for the same mesh and resolution can be passed.
+def insideVerts(co, tris, points, resolution=64, occupancy=None):
+    if occupancy is None:
+        occupancy = VoxelOccupancy(co, tris, resolution)
+    return occupancy.classify(points, fallback=lambda indices: insideExact(co, tris, points[indices]))
+
+# Determines all the verts1 that are connected to any vert from verts2, given
+# the boolean mask of verts1 and the (n, 2) edge array. Every other vertex is
+# taken to be in verts2.
+def determineBoundaryVerts(mask1, edges):
+    crossing = mask1[edges[:, 0]] != mask1[edges[:, 1]]
+    edges = edges[crossing]
+    return np.unique(np.where(mask1[edges[:, 0]], edges[:, 0], edges[:, 1]))
+
+# Labels the connected components of the vertices in mask, connected by the
+# (n, 2) edges. Union-find on whole arrays: the edges hook the larger of their
+# two roots onto the smaller one, pointer jumping flattens the trees again.
+# Vertices outside of mask get -1, the islands are numbered from 0.
+def islands(mask, edges):
+    edges = edges[mask[edges[:, 0]] & mask[edges[:, 1]]]
+    u, v = edges[:, 0], edges[:, 1]
+    parent = np.arange(len(mask))
+    while True:
+        ru, rv = parent[u], parent[v]
+        differ = ru != rv
+        if not differ.any():
+            break
+        np.minimum.at(parent, np.maximum(ru, rv)[differ], np.minimum(ru, rv)[differ])
+        while True:
+            grandparent = parent[parent]
+            if (grandparent == parent).all():
+                break
+            parent = grandparent
+    labels = np.full(len(mask), -1, dtype=np.int64)
+    labels[mask] = np.unique(parent[mask], return_inverse=True)[1].reshape(-1)
+    return labels
+
+# Bounding boxes (minimum and maximum corner) of the islands of the points
+def islandBoxes(labels, points):
+    k = labels.max() + 1
+    inside = labels >= 0
+    lo = np.full((k, 3), np.inf)
+    hi = np.full((k, 3), -np.inf)
+    np.minimum.at(lo, labels[inside], points[inside])
+    np.maximum.at(hi, labels[inside], points[inside])
+    return lo, hi
+
+# Pairs the islands of two objects whose bounding boxes overlap. Returns a
+# boolean (islands1, islands2) matrix.
+def matchIslands(labels1, points1, labels2, points2):
+    lo1, hi1 = islandBoxes(labels1, points1)
+    lo2, hi2 = islandBoxes(labels2, points2)
+    return (lo1[:, None] <= hi2[None]).all(2) & (lo2[None] <= hi1[:, None]).all(2)
+
+# Returns the delta at which the original search (starting at delta_initial,
+# growing by delta_increase until a hard object vertex is closer than delta)
+# finds the first vertex, given the distance to the nearest one. The search
+# gave up once delta exceeded 100.
+def indentationDelta(nearest, delta_initial, delta_increase):
+    steps = np.maximum(np.floor((nearest - delta_initial) / delta_increase) + 1, 0)
+    # the vertex has to be strictly closer than delta
+    steps = steps + (delta_initial + steps * delta_increase <= nearest)
+    delta = delta_initial + steps * delta_increase
+    found = np.isfinite(nearest) & ((steps == 0) | (delta <= 100))
+    return np.where(found, delta, 0), found
+
+# Splits the vertices of both objects into islands and pairs the islands
+# that pierce each other, so that every dent only looks at the hard object
+# vertices of its own contact. Returns a list of (rows of overlap_verts_s in
+# the island, the hard object vertices it can reach, a PointGrid of their
+# world coordinates, the distance of every row to the nearest of them).
+def indentationIslands(overlap_verts_s, soft, overlap_verts_h, hard, co):
+    verts1 = transformPoints(soft.matrix, co)
+    verts2 = transformPoints(hard.matrix, hard.co)
+    mask1 = np.zeros(len(co), dtype=bool)
+    mask1[overlap_verts_s] = True
+    mask2 = np.zeros(len(hard.co), dtype=bool)
+    mask2[overlap_verts_h] = True
+    islands1 = islands(mask1, soft.edges)
+    islands2 = islands(mask2, hard.edges)
+    touching = matchIslands(islands1, verts1, islands2, verts2)
+
+    groups = []
+    order = np.argsort(islands1[overlap_verts_s], kind="stable")
+    splits = np.flatnonzero(np.diff(islands1[overlap_verts_s][order])) + 1
+    for rows in np.split(order, splits):
+        island = islands1[overlap_verts_s[rows[0]]]
+        if touching[island].any():
+            verts_h = np.flatnonzero(touching[island][np.maximum(islands2, 0)] & mask2)
+        else:
+            # no hard island reaches into this one, fall back to all of them
+            verts_h = overlap_verts_h
+        if len(verts_h) == 0:
+            continue
+        # The hard object vertices are indexed once, a radius query per soft
+        # vertex replaces the scan over all of them for every delta
+        grid = PointGrid(verts2[verts_h])
+        nearest, _ = grid.nearest(verts1[overlap_verts_s[rows]])
+        groups.append((rows, verts_h, grid, nearest))
+    return groups
+
+# Finds where the verts in overlap_verts_s hit the hard object when moved
+# along the average normal of the hard object vertices around them. Returns
+# the indices of the verts that hit it, the hit locations in soft object
+# local coordinates and the hard object normals at them.
+def indentationHits(overlap_verts_s, soft, hard, groups, delta_initial, delta_increase, co):
+    verts1 = transformPoints(soft.matrix, co)
+    normals2 = vertexNormals(hard.co, hard.tris)
+    nearest = np.full(len(overlap_verts_s), np.inf)
+    sums = np.zeros((len(overlap_verts_s), 3))
+    counts = np.zeros(len(overlap_verts_s), dtype=np.int64)
+    for rows, verts_h, grid, nearest_rows in groups:
+        nearest[rows] = nearest_rows
+        delta, _ = indentationDelta(nearest_rows, delta_initial, delta_increase)
+        sums[rows], counts[rows] = grid.radius_sum(verts1[overlap_verts_s[rows]], delta, normals2[verts_h])
+    _, found = indentationDelta(nearest, delta_initial, delta_increase)
+    if not found.all():
+        print("Error: no overlapping vertices for %d verts." % (~found).sum())
+
+    # Calculate the average normal of all hard object vertices that are inside the soft object
+    valid = found & (counts > 0)
+    indices = overlap_verts_s[valid]
+    average_displace = sums[valid] / counts[valid][:, None]
+
+    # Use this average to displace all soft object vertices inside the hard object
+    origins = transformPoints(np.linalg.inv(hard.matrix), verts1[indices])
+    hit, hitloc, normal, _ = rayCast(hard.co, hard.tris, origins, average_displace)
+    hard_to_soft = np.linalg.inv(soft.matrix) @ hard.matrix
+    return indices[hit], transformPoints(hard_to_soft, hitloc[hit]), normal[hit]
+
+# Moves the hit verts onto their hit locations, displace_increase further
+# along the hard object normal. Returns the total distance moved.
+def displace(co, hits, displace_increase):
+    indices, hitloc_local, normal = hits
+    hitloc_local = hitloc_local + displace_increase * normal
+    dist_total = np.linalg.norm(hitloc_local - co[indices], axis=1).sum()
+    co[indices] = hitloc_local
+    return dist_total
+
+# Depresses all verts in overlap_verts_s (in soft) onto the verts in overlap_verts_h (in hard).
+# co holds the soft object coordinates, which are displaced in place.
+def indentationFunction(overlap_verts_s, soft, overlap_verts_h, hard, delta_initial, displace_increase, co, delta_increase):
+    dist_total = 0
+    if len(overlap_verts_s) == 0:
+        return dist_total
+    groups = indentationIslands(overlap_verts_s, soft, overlap_verts_h, hard, co)
+    hits = indentationHits(overlap_verts_s, soft, hard, groups, delta_initial, delta_increase, co)
+    return dist_total + displace(co, hits, displace_increase)
+
+# Finds the mininum distances between each vert from verts1_i and verts2_i,
+# given the (n, 3) array of vertex coordinates in object local coordinates
+def minimumDistances(verts1_i, verts2_i, co):
+    indices1 = np.asarray(verts1_i, dtype=np.int64)
+    indices2 = np.asarray(verts2_i, dtype=np.int64)
+    dist, _ = PointGrid(co[indices2]).nearest(co[indices1], exclude_zero=True)
+    return dict(zip(indices1.tolist(), dist.tolist()))
+
+# Finds the maximum distance between the vertex coordinates, with a relative
+# error of at most error
+def maximumDistance(co, error=0.01):
+    return diameter(co, error)
+
+# Singular function to describe the surface deformation of the object.
+# Is a simple half-parabola until indentRage is reached, at which point it remains constant.
+def distributionFunction(x, dist_total, dist_max, indentRange, indentDepth, volumeFactor):
+    a = (dist_total + indentDepth * dist_max) / (indentRange**3 / 3 - indentRange**2 * dist_max)
+    c = volumeFactor * (-indentDepth - a * indentRange**2)
+    return np.where(x <= indentRange, a * (x - indentRange)**2 + c, c)
+
+# Number of edges used by only one triangle, 0 for a closed mesh
+def openEdges(tris):
+    edges = np.sort(np.concatenate([tris[:, [0, 1]], tris[:, [1, 2]], tris[:, [2, 0]]]), axis=1)
+    _, counts = np.unique(edges, axis=0, return_counts=True)
+    return int((counts == 1).sum())
+
+# Volume enclosed by the triangles, the sum of the signed volumes of the
+# tetrahedra they span with the origin. Only meaningful for a closed mesh,
+# for an open one it depends on where the origin is.
+def volume(co, tris):
+    a, b, c = co[tris[:, 0]], co[tris[:, 1]], co[tris[:, 2]]
+    return (a * np.cross(b, c)).sum() / 6
+
+# Finds the volume factor at which volume_of(factor) reaches target. The
+# upper bound is doubled until it brackets target, then bisected. If target
+# cannot be reached, the factor with the smallest error is returned.
+def solveVolumeFactor(volume_of, target, tolerance=1e-6, iterations=60):
+    lo, hi = 0.0, 1.0
+    error_lo, error_hi = volume_of(lo) - target, volume_of(hi) - target
+    best = min([(abs(error_lo), lo), (abs(error_hi), hi)])
+    while np.sign(error_lo) == np.sign(error_hi) and hi < 1e6:
+        lo, error_lo = hi, error_hi
+        hi = hi * 2
+        error_hi = volume_of(hi) - target
+        best = min(best, (abs(error_hi), hi))
+    if np.sign(error_lo) == np.sign(error_hi):
+        return best[1]
+    for _ in range(iterations):
+        mid = (lo + hi) / 2
+        error_mid = volume_of(mid) - target
+        if abs(error_mid) <= tolerance * abs(target):
+            return mid
+        if np.sign(error_mid) == np.sign(error_lo):
+            lo, error_lo = mid, error_mid
+        else:
+            hi, error_hi = mid, error_mid
+    return (lo + hi) / 2
+
+# Dents soft where hard intersects it. co are the soft object coordinates to
+# deform (the shape key) and basis those of its relative key, both default to
+# soft.co. Returns the deformed coordinates in soft object local coordinates.
+# With solve_volume, the volume factor of the distribution is solved for so
+# that volume_preservation of the volume lost by the indentation is restored,
+# otherwise (and for an open soft object) volume_preservation is the volume
+# factor itself. Intermediate
+# results are kept in cache (a new one if not given) for the next run. The
+# duration of every stage is added to timings and the volumes to volumes, if
+# given.
+def deform(soft, hard, co=None, basis=None, displace_increase=0.02, sinkin_range=1.2, calculate_sinkin_range=True, delta_initial=5.0, delta_increase=0.1, volume_preservation=0.2, voxel_resolution=64, diameter_error=0.01, falloff_mode='EUCLIDEAN', solve_volume=True, cache=None, timings=None, volumes=None):
+    co1 = soft.co if co is None else np.asarray(co, dtype=np.float64).reshape(-1, 3)
+    basis = soft.co if basis is None else np.asarray(basis, dtype=np.float64).reshape(-1, 3)
+    cache = Cache() if cache is None else cache
+
+    # The occupancies are in object local coordinates, they stay valid as
+    # long as the mesh does not change
+    soft_geometry = fingerprint(soft.co, soft.tris, soft.edges)
+    hard_geometry = fingerprint(hard.co, hard.tris, hard.edges)
+    key = (soft_geometry, hard_geometry, fingerprint(soft.matrix, hard.matrix, co1), voxel_resolution)
+
+    def classify():
+        # Vertices of soft object inside hard object
+        soft_in_hard = transformPoints(np.linalg.inv(hard.matrix) @ soft.matrix, co1)
+        occupancy = cache.get("hard_occupancy", (hard_geometry, voxel_resolution), lambda: VoxelOccupancy(hard.co, hard.tris, voxel_resolution))
+        inside = insideVerts(hard.co, hard.tris, soft_in_hard, voxel_resolution, occupancy)
+        # Vertices of hard object inside soft object
+        hard_in_soft = transformPoints(np.linalg.inv(soft.matrix) @ hard.matrix, hard.co)
+        occupancy = cache.get("soft_occupancy", (soft_geometry, voxel_resolution), lambda: VoxelOccupancy(soft.co, soft.tris, voxel_resolution))
+        inside_vert_ho = insideVerts(soft.co, soft.tris, hard_in_soft, voxel_resolution, occupancy)
+        return inside, inside_vert_ho, determineBoundaryVerts(inside, soft.edges)
+
+    with stage(timings, "classify"):
+        inside, inside_vert_ho, boundaryVerts_so = cache.get("classify", key, classify)
+        inside_verts_new = np.flatnonzero(inside)
+        outside_verts = np.flatnonzero(~inside)
+
+    dist_total = 0
+
+    if len(inside_verts_new) == 0:
+        print("No vertices of the soft object are inside the hard object.")
+        return co1.copy()
+
+    # STEP 1: Find overlapping faces, and displace vertices so that they no longer overlap
+
+    print("Displacing verts")
+    with stage(timings, "indent"):
+        groups = cache.get("islands", key, lambda: indentationIslands(inside_verts_new, soft, np.flatnonzero(inside_vert_ho), hard, co1))
+        hits = cache.get("hits", (key, delta_initial, delta_increase), lambda: indentationHits(inside_verts_new, soft, hard, groups, delta_initial, delta_increase, co1))
+        co = co1.copy()
+        dist_total = dist_total + displace(co, hits, displace_increase)
+    if dist_total == 0:
+        # grazing contact, the sink-in range would be 0
+        print("No vertices of the soft object were displaced.")
+        return co
+
+    # STEP 2: Calculate sink-in and volume distribution
+
+    print("Getting the shortest distance")
+    with stage(timings, "distances"):
+        def distances():
+            # Calculate shortest distance between an inside and an outside vert
+            minDist = minimumDistances(inside_verts_new, inside_verts_new, co1)
+            return min(minDist.values(), default=inf)
+        shortest_dist = cache.get("distances", key, distances)
+        if not np.isfinite(shortest_dist):
+            # a single inside vertex, there is no distance to scale by
+            shortest_dist = 0.0
+        # The diameter only depends on the soft object itself
+        maxDist = cache.get("diameter", (fingerprint(co1), diameter_error), lambda: maximumDistance(co1, diameter_error))
+        sinkin_depth = dist_total / len(inside_verts_new)
+        if calculate_sinkin_range:
+            sinkin_range = sqrt(sinkin_depth)
+
+    with stage(timings, "falloff"):
+        # Distance of every vertex to its closest boundary vertex, the same
+        # as long as the boundary does not change
+        boundary = (soft_geometry, fingerprint(co1, boundaryVerts_so), falloff_mode)
+        if falloff_mode == 'GEODESIC':
+            dist_boundary, closest_boundary = cache.get("falloff", boundary + (sinkin_range,), lambda: falloff.geodesic(co1, soft.edges, boundaryVerts_so, sinkin_range))
+        else:
+            dist_boundary, closest_boundary = cache.get("falloff", boundary, lambda: falloff.euclidean(co1, boundaryVerts_so))
+
+    with stage(timings, "distribute"):
+        # Normals of the indented shape
+        normals = vertexNormals(co, soft.tris)
+
+        dist_min = dist_boundary[outside_verts]
+        closest_vert = np.where(closest_boundary[outside_verts] >= 0, closest_boundary[outside_verts], outside_verts)
+        indent = co[closest_vert] - basis[closest_vert]
+        indent_depth = np.linalg.norm(indent, axis=1)
+        indent_dir = -indent / np.maximum(indent_depth, 1e-12)[:, None]
+        dist_scaled = dist_total * shortest_dist / sqrt(len(inside_verts_new))
+
+    def distribute(volumeFactor):
+        move_dist = distributionFunction(dist_min, dist_scaled, maxDist, sinkin_range, indent_depth, volumeFactor)
+        closest_vert_move = np.where((move_dist < 0)[:, None], indent_dir, normals[outside_verts])
+        result = co.copy()
+        result[outside_verts] = co[outside_verts] + move_dist[:, None] * closest_vert_move
+        return result
+
+    volume_original = volume(co1, soft.tris)
+    volume_indented = volume(co, soft.tris)
+    target = volume_indented + volume_preservation * (volume_original - volume_indented)
+    closed = cache.get("open_edges", soft_geometry, lambda: openEdges(soft.tris)) == 0
+    if solve_volume and not closed:
+        print("Warning: the soft object is not closed, its volume cannot be preserved exactly.")
+    if solve_volume and closed:
+        with stage(timings, "volume"):
+            factor = solveVolumeFactor(lambda f: volume(distribute(f), soft.tris), target)
+    else:
+        factor = volume_preservation
+
+    with stage(timings, "distribute"):
+        co = distribute(factor)
+    if volumes is not None:
+        volumes.update(original=volume_original, indented=volume_indented, target=target,
+                       result=volume(co, soft.tris), factor=factor, closed=closed)
+    return co
+
+# Bounding box (minimum and maximum corner) of the points
+def box(points):
+    return points.min(0), points.max(0)
+
+def boxesOverlap(a, b):
+    return bool((a[0] <= b[1]).all() and (b[0] <= a[1]).all())
+
+# Dents soft for every frame of an animated hard object. frames yields the
+# hard object Mesh of every frame, with its matrix (and coordinates, for a
+# deforming hard object) at that frame. Yields the deformed coordinates of
+# every frame, the parameters are those of deform.
+# The frames share one cache, so the occupancies of rigidly moving objects,
+# the diameter and, while the boundary of the dent stays the same, the
+# falloff are only computed once. A frame is not recomputed at all if the
+# box swept by the hard object since the last frame misses the soft object,
+# then neither frame has a dent.
+def bake(soft, frames, co=None, basis=None, cache=None, timings=None, **parameters):
+    co1 = soft.co if co is None else np.asarray(co, dtype=np.float64).reshape(-1, 3)
+    cache = Cache() if cache is None else cache
+    soft_box = box(transformPoints(soft.matrix, co1))
+    last_box = None
+    result = None
+    for hard in frames:
+        hard_box = box(transformPoints(hard.matrix, hard.co))
+        swept = hard_box if last_box is None else (np.minimum(last_box[0], hard_box[0]), np.maximum(last_box[1], hard_box[1]))
+        last_box = hard_box
+        if result is None or boxesOverlap(swept, soft_box):
+            result = deform(soft, hard, co1, basis, cache=cache, timings=timings, **parameters)
+        yield result
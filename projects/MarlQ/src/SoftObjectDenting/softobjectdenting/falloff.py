@@ -0,0 +1,71 @@
+"""Copyright (c) 2021 LMU Munich Geometry Processing Authors. All rights reserved.
+Created by Marcel Quanz.
+
+Use of this source code is governed by a GNU GPLv3 license that can be found
+in the LICENSE file."""
+
+import heapq
+import numpy as np
+
+from .spatial import PointGrid
+
+# Distance from every vertex to the closest of the source vertices, and the
+# index of that source vertex. Used for the sink-in distribution around the
+# indentation.
+
+# Straight-line distances, one nearest neighbour query per vertex
+def euclidean(co, sources):
+    sources = np.asarray(sources, dtype=np.int64)
+    dist, nearest = PointGrid(co[sources]).nearest(co)
+    closest = np.where(nearest >= 0, sources[np.maximum(nearest, 0)], -1)
+    return dist, closest
+
+# Distances along the edges of the mesh (multi-source Dijkstra). The search
+# stops at max_distance, vertices further away get an infinite distance and
+# the closest source by straight-line distance. Unlike the euclidean falloff,
+# it does not leak across thin parts or gaps of the mesh.
+def geodesic(co, edges, sources, max_distance=np.inf):
+    n = len(co)
+    sources = np.asarray(sources, dtype=np.int64)
+    dist = np.full(n, np.inf)
+    closest = np.full(n, -1, dtype=np.int64)
+    if len(sources) == 0:
+        return dist, closest
+
+    # Adjacency in compressed rows
+    both = np.concatenate([edges, edges[:, ::-1]])
+    order = np.argsort(both[:, 0], kind="stable")
+    neighbours = both[order, 1]
+    lengths = np.linalg.norm(co[both[order, 0]] - co[neighbours], axis=1)
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(both[:, 0], minlength=n))])
+    neighbours, lengths, indptr = neighbours.tolist(), lengths.tolist(), indptr.tolist()
+
+    d = [np.inf] * n
+    c = [-1] * n
+    heap = []
+    for s in sources.tolist():
+        d[s] = 0.0
+        c[s] = s
+        heap.append((0.0, s))
+    heapq.heapify(heap)
+    done = [False] * n
+    while heap:
+        du, u = heapq.heappop(heap)
+        if done[u]:
+            continue
+        done[u] = True
+        for k in range(indptr[u], indptr[u + 1]):
+            v = neighbours[k]
+            dv = du + lengths[k]
+            if dv < d[v] and dv <= max_distance:
+                d[v] = dv
+                c[v] = c[u]
+                heapq.heappush(heap, (dv, v))
+
+    dist[:] = d
+    closest[:] = c
+    unreached = np.flatnonzero(closest < 0)
+    if len(unreached) > 0:
+        _, nearest = PointGrid(co[sources]).nearest(co[unreached])
+        closest[unreached] = sources[nearest]
+    return dist, closest
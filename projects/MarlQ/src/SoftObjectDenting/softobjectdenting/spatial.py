@@ -0,0 +1,304 @@
+"""Copyright (c) 2021 LMU Munich Geometry Processing Authors. All rights reserved.
+Created by Marcel Quanz.
+
+Use of this source code is governed by a GNU GPLv3 license that can be found
+in the LICENSE file."""
+
+import numpy as np
+
+# Offset of the lattice in cells, irrational so that lattice lines do not run
+# through the vertices and edges of axis-aligned meshes
+JITTER = np.array([0.1372, 0.2718, 0.4142])
+
+# Inside/outside classification of points against a closed triangle mesh.
+# The corners of a voxel lattice are classified once by the parity of the
+# mesh crossings along x lines, then a point is inside if all corners of its
+# cell are. Cells that the surface passes through (and their neighbours) are
+# ambiguous, points in them are left to a slower exact test.
+class VoxelOccupancy:
+    def __init__(self, verts, tris, resolution=64):
+        lo, hi = verts.min(0), verts.max(0)
+        self.h = max((hi - lo).max(), 1e-9) / resolution
+        self.origin = lo - self.h * (1 + JITTER)
+        self.shape = np.ceil((hi - self.origin) / self.h).astype(int) + 2
+        corners = self._corners(verts, tris)
+
+        # Cells with 8 corners inside, and cells where the corners disagree
+        cells = [corners[i:i + self.shape[0] - 1, j:j + self.shape[1] - 1, k:k + self.shape[2] - 1]
+                 for i in (0, 1) for j in (0, 1) for k in (0, 1)]
+        all_in = np.logical_and.reduce(cells)
+        mixed = np.logical_or.reduce(cells) & ~all_in
+        # The surface can also pass through a cell without changing the side
+        # of any corner (parts thinner than a cell), so every cell overlapped
+        # by the bounding box of a triangle is ambiguous as well
+        mixed |= self._touched(verts, tris)
+        for axis in range(3):
+            mixed = _dilate(mixed, axis)
+        self.corners = corners
+        self.inside = all_in & ~mixed
+        self.ambiguous = mixed
+
+    # Marks the cells overlapped by the bounding boxes of the triangles, by
+    # summing +-1 at the corners of every box and integrating along all axes
+    def _touched(self, verts, tris):
+        corners = verts[tris]
+        c0 = np.clip(np.floor((corners.min(1) - self.origin) / self.h).astype(int), 0, self.shape - 2)
+        c1 = np.clip(np.floor((corners.max(1) - self.origin) / self.h).astype(int), 0, self.shape - 2) + 1
+        boxes = np.zeros(tuple(self.shape), dtype=np.int32)
+        for i in (0, 1):
+            for j in (0, 1):
+                for k in (0, 1):
+                    index = tuple(np.where(bit, c1[:, axis], c0[:, axis]) for axis, bit in enumerate((i, j, k)))
+                    np.add.at(boxes, index, (-1) ** (i + j + k))
+        for axis in range(3):
+            boxes = np.cumsum(boxes, axis=axis)
+        return boxes[:-1, :-1, :-1] > 0
+
+    # Classifies the lattice corners by counting the crossings of x lines
+    # through the corners with the triangles to the left of every corner
+    def _corners(self, verts, tris):
+        nx, ny, nz = self.shape
+        a, b, c = verts[tris[:, 0]], verts[tris[:, 1]], verts[tris[:, 2]]
+        tri_lo = np.minimum(np.minimum(a, b), c)
+        tri_hi = np.maximum(np.maximum(a, b), c)
+        j0 = np.ceil((tri_lo[:, 1] - self.origin[1]) / self.h).astype(int)
+        j1 = np.floor((tri_hi[:, 1] - self.origin[1]) / self.h).astype(int)
+        k0 = np.ceil((tri_lo[:, 2] - self.origin[2]) / self.h).astype(int)
+        k1 = np.floor((tri_hi[:, 2] - self.origin[2]) / self.h).astype(int)
+        nj = np.maximum(j1 - j0 + 1, 0)
+        nk = np.maximum(k1 - k0 + 1, 0)
+        n = nj * nk
+
+        # One candidate per triangle and x line in its projected bounding box
+        t = np.repeat(np.arange(len(tris)), n)
+        local = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        j = j0[t] + local // np.maximum(nk[t], 1)
+        k = k0[t] + local % np.maximum(nk[t], 1)
+        y = self.origin[1] + j * self.h
+        z = self.origin[2] + k * self.h
+
+        # Barycentric coordinates in the yz plane
+        ay, az, by, bz, cy, cz = a[t, 1], a[t, 2], b[t, 1], b[t, 2], c[t, 1], c[t, 2]
+        w0 = (by - y) * (cz - z) - (cy - y) * (bz - z)
+        w1 = (cy - y) * (az - z) - (ay - y) * (cz - z)
+        w2 = (ay - y) * (bz - z) - (by - y) * (az - z)
+        area = w0 + w1 + w2
+        hit = (area != 0) & (((w0 >= 0) & (w1 >= 0) & (w2 >= 0)) | ((w0 <= 0) & (w1 <= 0) & (w2 <= 0)))
+        area = np.where(hit, area, 1)
+        x = (w0 * a[t, 0] + w1 * b[t, 0] + w2 * c[t, 0]) / area
+
+        # A crossing counts for all corners at or right of it
+        first = np.clip(np.ceil((x[hit] - self.origin[0]) / self.h).astype(int), 0, nx)
+        counts = np.zeros((nx + 1, ny, nz), dtype=np.int32)
+        np.add.at(counts, (first, j[hit], k[hit]), 1)
+        return (np.cumsum(counts, axis=0)[:nx] % 2) == 1
+
+    # Returns a boolean array, True for points inside. The indices of points
+    # in ambiguous cells are passed to fallback, which returns their
+    # classification. Without fallback they take the nearest corner's class.
+    def classify(self, points, fallback=None):
+        rel = (points - self.origin) / self.h
+        cell = np.floor(rel).astype(int)
+        valid = np.all((cell >= 0) & (cell < self.shape - 1), axis=1)
+        result = np.zeros(len(points), dtype=bool)
+        i, j, k = cell[valid].T
+        result[valid] = self.inside[i, j, k]
+
+        ambiguous = np.flatnonzero(valid)[self.ambiguous[i, j, k]]
+        if len(ambiguous) > 0:
+            if fallback is not None:
+                result[ambiguous] = fallback(ambiguous)
+            else:
+                nearest = np.clip(np.rint(rel[ambiguous]).astype(int), 0, self.shape - 1)
+                result[ambiguous] = self.corners[nearest[:, 0], nearest[:, 1], nearest[:, 2]]
+        return result
+
+# Grows a boolean grid by one cell along axis
+def _dilate(grid, axis):
+    out = grid.copy()
+    lo = [slice(None)] * 3
+    hi = [slice(None)] * 3
+    lo[axis], hi[axis] = slice(None, -1), slice(1, None)
+    out[tuple(lo)] |= grid[tuple(hi)]
+    out[tuple(hi)] |= grid[tuple(lo)]
+    return out
+
+# Uniform grid over a point set for nearest neighbour and radius queries.
+# Points are sorted by cell, a query gathers the points of the cells around
+# its own cell. Queries whose neighbourhood covers more cells than are
+# occupied fall back to comparing against all points.
+class PointGrid:
+    def __init__(self, points, cell=None, chunk=4096):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        self.chunk = chunk
+        lo = self.points.min(0) if len(self.points) else np.zeros(3)
+        hi = self.points.max(0) if len(self.points) else np.zeros(3)
+        if cell is None:
+            # about two points per occupied cell on a surface
+            extent = np.maximum(hi - lo, 1e-9)
+            cell = max(np.sqrt(np.prod(np.sort(extent)[1:]) / max(len(self.points), 1)) * 1.5, 1e-9)
+        self.h = cell
+        self.origin = lo
+        cells = np.floor((self.points - lo) / cell).astype(np.int64)
+        self.dims = cells.max(0) + 1 if len(self.points) else np.ones(3, dtype=np.int64)
+        keys = self._key(cells)
+        self.order = np.argsort(keys, kind="stable")
+        self.keys, self.starts, counts = np.unique(keys[self.order], return_index=True, return_counts=True)
+        self.ends = self.starts + counts
+        self.coarse = {}
+        # a dense table of all cells if it is small, to look up empty cells fast
+        self.table = None
+        if np.prod(self.dims) <= 1 << 24:
+            self.table = np.full(np.prod(self.dims), -1, dtype=np.int64)
+            self.table[self.keys] = np.arange(len(self.keys))
+
+    def _key(self, cells):
+        return (cells[:, 0] * self.dims[1] + cells[:, 1]) * self.dims[2] + cells[:, 2]
+
+    # Returns (query, point) index pairs of all points in the cube of
+    # (2 * ring + 1)^3 cells around the cell of each query
+    def _pairs(self, queries, ring):
+        r = np.arange(-ring, ring + 1)
+        offsets = np.stack(np.meshgrid(r, r, r, indexing="ij"), -1).reshape(-1, 3)
+        cells = np.floor((queries - self.origin) / self.h).astype(np.int64)
+        neighbours = (cells[:, None, :] + offsets[None]).reshape(-1, 3)
+        valid = np.all((neighbours >= 0) & (neighbours < self.dims), axis=1)
+        keys = self._key(np.where(valid[:, None], neighbours, 0))
+        if self.table is not None:
+            pos = self.table[keys]
+            found = valid & (pos >= 0)
+        else:
+            pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+            found = valid & (self.keys[pos] == keys)
+        q = np.repeat(np.arange(len(queries)), len(offsets))[found]
+        start, end = self.starts[pos[found]], self.ends[pos[found]]
+        n = end - start
+        local = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        return np.repeat(q, n), self.order[np.repeat(start, n) + local]
+
+    # Whether gathering the cube of cells is cheaper than comparing with all points
+    def _fits(self, ring):
+        return (2 * ring + 1) ** 3 <= min(len(self.keys), len(self.points) // 4)
+
+    # Returns a grid over the same points with cells of the given size
+    def _coarse(self, cell):
+        if cell not in self.coarse:
+            self.coarse[cell] = PointGrid(self.points, cell, self.chunk)
+        return self.coarse[cell]
+
+    # Squared distances between all queries and all points
+    def _distances(self, queries):
+        d = (queries ** 2).sum(1)[:, None] + (self.points ** 2).sum(1)[None] - 2 * queries @ self.points.T
+        return np.maximum(d, 0)
+
+    # Returns the distance to and the index of the nearest point of every
+    # query, inf and -1 if there is none. With exclude_zero, points at
+    # distance 0 (the query itself and duplicates) are skipped.
+    def nearest(self, queries, exclude_zero=False):
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+        dist = np.full(len(queries), np.inf)
+        index = np.full(len(queries), -1, dtype=np.int64)
+        if len(self.points) == 0:
+            return dist, index
+        for c in range(0, len(queries), self.chunk):
+            pending = np.arange(c, min(c + self.chunk, len(queries)))
+            ring = 1
+            while len(pending) > 0:
+                if not self._fits(ring):
+                    d, i = self._nearest_brute(queries[pending], exclude_zero)
+                    dist[pending], index[pending] = d, i
+                    break
+                q, p = self._pairs(queries[pending], ring)
+                d = np.linalg.norm(queries[pending][q] - self.points[p], axis=1)
+                if exclude_zero:
+                    d[d == 0] = np.inf
+                best = np.lexsort((d, q))
+                first = best[np.unique(q[best], return_index=True)[1]]
+                dist[pending[q[first]]] = d[first]
+                index[pending[q[first]]] = np.where(np.isinf(d[first]), -1, p[first])
+                # points outside the searched cube are at least ring cells away
+                pending = pending[dist[pending] > ring * self.h]
+                ring *= 2
+        return dist, index
+
+    def _nearest_brute(self, queries, exclude_zero):
+        dist = np.empty(len(queries))
+        index = np.empty(len(queries), dtype=np.int64)
+        step = max(1, (1 << 22) // len(self.points))
+        for c in range(0, len(queries), step):
+            q = queries[c:c + step]
+            d = self._distances(q)
+            if exclude_zero:
+                # the expansion is inexact, zero distances are tested exactly
+                d[np.all(q[:, None, :] == self.points[None], axis=2)] = np.inf
+            i = d.argmin(1)
+            index[c:c + step] = i
+            dist[c:c + step] = np.where(np.isinf(d[np.arange(len(q)), i]), np.inf, np.linalg.norm(q - self.points[i], axis=1))
+        index[np.isinf(dist)] = -1
+        return dist, index
+
+    # Returns the sums of values over the points closer than radii to every
+    # query, and the number of those points
+    def radius_sum(self, queries, radii, values):
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+        values = np.asarray(values, dtype=np.float64).reshape(len(self.points), -1)
+        radii = np.broadcast_to(radii, len(queries))
+        sums = np.zeros((len(queries), values.shape[1]))
+        counts = np.zeros(len(queries), dtype=np.int64)
+        if len(self.points) == 0:
+            return sums, counts
+        rings = np.ceil(radii / self.h).astype(np.int64)
+        for ring in np.unique(rings):
+            group = np.flatnonzero(rings == ring)
+            # large radii are gathered from a grid with cells of the radius
+            grid = self
+            if ring > 1:
+                grid, ring = self._coarse(radii[group].max()), 1
+            for c in range(0, len(group), self.chunk):
+                g = group[c:c + self.chunk]
+                if grid._fits(ring):
+                    q, p = grid._pairs(queries[g], ring)
+                    inside = np.linalg.norm(queries[g][q] - self.points[p], axis=1) < radii[g][q]
+                    q, p = q[inside], p[inside]
+                    counts[g] = np.bincount(q, minlength=len(g))
+                    for k in range(values.shape[1]):
+                        sums[g, k] = np.bincount(q, weights=values[p, k], minlength=len(g))
+                else:
+                    step = max(1, (1 << 22) // len(self.points))
+                    for s in range(0, len(g), step):
+                        gs = g[s:s + step]
+                        inside = (self._distances(queries[gs]) < radii[gs, None] ** 2).astype(np.float64)
+                        sums[gs] = inside @ values
+                        counts[gs] = inside.sum(1).astype(np.int64)
+        return sums, counts
+
+# Returns the largest distance between two of the points, which is at least
+# 1 / (1 + error) times the exact one. The points extreme along directions
+# through a k x k grid on three cube faces are compared pairwise. Every
+# direction is within sqrt(2) / k radians of a grid direction, so the widths
+# along the grid directions are at least cos(sqrt(2) / k) times the diameter.
+def diameter(points, error=0.01, chunk=1 << 15):
+    if len(points) < 2:
+        return 0.0
+    k = max(1, int(np.ceil(np.sqrt(2) / np.arccos(1 / (1 + error)))))
+    s = (np.arange(k) + 0.5) / k * 2 - 1
+    a, b = (x.ravel() for x in np.meshgrid(s, s))
+    one = np.ones_like(a)
+    dirs = np.concatenate([np.stack([one, a, b], 1), np.stack([a, one, b], 1), np.stack([a, b, one], 1)])
+    dirs /= np.linalg.norm(dirs, axis=1)[:, None]
+
+    hi = np.full(len(dirs), -np.inf)
+    lo = np.full(len(dirs), np.inf)
+    hi_index = np.zeros(len(dirs), dtype=np.int64)
+    lo_index = np.zeros(len(dirs), dtype=np.int64)
+    for c in range(0, len(points), chunk):
+        proj = points[c:c + chunk] @ dirs.T
+        i, j = proj.argmax(0), proj.argmin(0)
+        columns = np.arange(len(dirs))
+        better = proj[i, columns] > hi
+        hi[better], hi_index[better] = proj[i, columns][better], i[better] + c
+        better = proj[j, columns] < lo
+        lo[better], lo_index[better] = proj[j, columns][better], j[better] + c
+
+    extremes = points[np.unique(np.concatenate([hi_index, lo_index]))]
+    return float(np.sqrt(((extremes[:, None, :] - extremes[None]) ** 2).sum(2).max()))
@@ -11,7 +11,9 @@ from bpy.types import (Panel,
                        )
 
 from bpy.props import (BoolProperty,
+                       EnumProperty,
                        FloatProperty,
+                       IntProperty,
                        PointerProperty
                        )
 
@@ -64,11 +66,41 @@ class SODSettings(PropertyGroup):
         min = 0.0001
         )
 
+    falloff_mode : EnumProperty(
+        name = "Sink-in distance",
+        description = "How the distance to the indentation is measured for the sink-in.",
+        items = [('EUCLIDEAN', "Euclidean", "Straight-line distance (fast)"),
+                 ('GEODESIC', "Geodesic", "Distance along the surface, the sink-in does not spread across thin parts or gaps of the mesh")],
+        default = 'EUCLIDEAN'
+        )
+
     volume_preservation : FloatProperty(
         name = "Volume preservation factor",
         description = "How much of the volume is presrved and distributed across the rest of the mesh.",
         default = 1.0,
         )
+
+    solve_volume : BoolProperty(
+        name = "Exact volume preservation",
+        description = "Solve for the distribution that restores the volume preservation factor of the volume lost by the indentation. Otherwise the factor scales the distribution directly.",
+        default = True
+        )
+
+    voxel_resolution : IntProperty(
+        name = "Voxel resolution",
+        description = "Number of voxels along the longest side of the hard object used to find the soft object vertices inside it. Only vertices close to its surface are ray cast, higher values make that band thinner.",
+        default = 64,
+        min = 4,
+        max = 512
+        )
+
+    diameter_error : FloatProperty(
+        name = "Diameter error",
+        description = "Maximum relative error of the estimated soft object diameter, which scales the sink-in distribution. Smaller values take longer.",
+        default = 0.01,
+        min = 0.001,
+        max = 1.0
+        )
     
 
 # ------------------------------------------------------------------------
@@ -82,14 +114,46 @@ class WM_OT_SOD(Operator):
     def execute(self, context):
         scene = context.scene
         sod_tool = scene.sod_tool
-        main.deform(from_mix=sod_tool.from_mix,
+        volumes = main.deform(from_mix=sod_tool.from_mix,
                     displace_increase=sod_tool.displace_increase, 
                     calculate_sinkin_range=sod_tool.calculate_sinkin_range,
                     sinkin_range=sod_tool.sinkin_range,
                     delta_initial=sod_tool.delta_initial,
                     delta_increase=sod_tool.delta_increase,
                     volume_preservation=sod_tool.volume_preservation,
-                    use_decimate=sod_tool.use_decimate)
+                    use_decimate=sod_tool.use_decimate,
+                    voxel_resolution=sod_tool.voxel_resolution,
+                    diameter_error=sod_tool.diameter_error,
+                    falloff_mode=sod_tool.falloff_mode,
+                    solve_volume=sod_tool.solve_volume)
+        if volumes and not volumes["closed"]:
+            self.report({'WARNING'}, "The soft object is not closed, its volume is not preserved exactly")
+        elif volumes:
+            error = (volumes["result"] - volumes["target"]) / volumes["original"]
+            self.report({'INFO'}, "Volume: %.4g (target %.4g, error %.3f%%)" % (volumes["result"], volumes["target"], error * 100))
+        return {'FINISHED'}
+
+
+class WM_OT_SOD_bake(Operator):
+    bl_idname = "wm.sod_bake"
+    bl_label = "Bake frame range"
+    bl_description = "Dent the soft object on every frame of the scene frame range, into one shape key per frame"
+
+    def execute(self, context):
+        scene = context.scene
+        sod_tool = scene.sod_tool
+        main.bake(scene.frame_start, scene.frame_end,
+                  displace_increase=sod_tool.displace_increase,
+                  calculate_sinkin_range=sod_tool.calculate_sinkin_range,
+                  sinkin_range=sod_tool.sinkin_range,
+                  delta_initial=sod_tool.delta_initial,
+                  delta_increase=sod_tool.delta_increase,
+                  volume_preservation=sod_tool.volume_preservation,
+                  use_decimate=sod_tool.use_decimate,
+                  voxel_resolution=sod_tool.voxel_resolution,
+                  diameter_error=sod_tool.diameter_error,
+                  falloff_mode=sod_tool.falloff_mode,
+                  solve_volume=sod_tool.solve_volume)
         return {'FINISHED'}
 
 
@@ -122,22 +186,29 @@ class OBJECT_PT_SODPanel(Panel):
         row.prop(sod_tool, "sinkin_range")
         if sod_tool.calculate_sinkin_range is True:
             row.enabled = False
+        layout.prop(sod_tool, "falloff_mode")
         layout.prop(sod_tool, "delta_initial")
         layout.prop(sod_tool, "delta_increase")
+        layout.prop(sod_tool, "voxel_resolution")
+        layout.prop(sod_tool, "diameter_error")
         layout.separator()
         layout.prop(sod_tool, "volume_preservation")
+        layout.prop(sod_tool, "solve_volume")
 
         layout.operator("wm.sod")
+        layout.operator("wm.sod_bake")
 
 
 def register():
     bpy.utils.register_class(SODSettings)
     bpy.utils.register_class(WM_OT_SOD)
+    bpy.utils.register_class(WM_OT_SOD_bake)
     bpy.utils.register_class(OBJECT_PT_SODPanel)
     bpy.types.Scene.sod_tool = PointerProperty(type=SODSettings)
 
 def unregister():
     bpy.utils.unregister_class(SODSettings)
     bpy.utils.unregister_class(WM_OT_SOD)
+    bpy.utils.unregister_class(WM_OT_SOD_bake)
     bpy.utils.unregister_class(OBJECT_PT_SODPanel)
     del bpy.types.Scene.sod_tool
\ No newline at end of file
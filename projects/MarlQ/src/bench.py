@@ -0,0 +1,191 @@
+"""Copyright (c) 2021 LMU Munich Geometry Processing Authors. All rights reserved.
+Created by Marcel Quanz.
+
+Use of this source code is governed by a GNU GPLv3 license that can be found
+in the LICENSE file."""
+
+# Times the stages of the denting outside of Blender, on the bunny dented by
+# procedural indenters of increasing density.
+#
+#   python bench.py                              # spheres into the bunny
+#   python bench.py --indenter box --subdivide 2
+#   python bench.py --soft mesh.obj --density 1 4 16
+#   python bench.py --soft sphere --subdivide 2  # closed, for the volume solve
+#   python bench.py --bake 48                    # a pressing and releasing indenter
+#   python bench.py --check                      # inside tests on aligned meshes
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "SoftObjectDenting"))
+from softobjectdenting import core
+
+BUNNY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "7-dda2", "data", "bunny.obj")
+STAGES = ["classify", "indent", "distances", "falloff", "volume", "distribute"]
+
+# Reads the vertices and the (fan triangulated) faces of an OBJ file
+def loadObj(path):
+    co, tris = [], []
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0] == "v":
+                co.append([float(x) for x in parts[1:4]])
+            elif parts[0] == "f":
+                face = [int(p.split("/")[0]) for p in parts[1:]]
+                face = [i - 1 if i > 0 else len(co) + i for i in face]
+                tris.extend([face[0], face[k], face[k + 1]] for k in range(1, len(face) - 1))
+    return np.array(co, dtype=np.float64), np.array(tris, dtype=np.int64)
+
+# Splits every triangle into four at its edge midpoints
+def subdivide(co, tris):
+    edges = np.sort(np.concatenate([tris[:, [0, 1]], tris[:, [1, 2]], tris[:, [2, 0]]]), axis=1)
+    edges, inverse = np.unique(edges, axis=0, return_inverse=True)
+    mid = len(co) + inverse.reshape(3, -1)
+    co = np.concatenate([co, (co[edges[:, 0]] + co[edges[:, 1]]) / 2])
+    a, b, c = tris.T
+    ab, bc, ca = mid
+    tris = np.concatenate([np.stack(t, 1) for t in [(a, ab, ca), (ab, b, bc), (ca, bc, c), (ab, bc, ca)]])
+    return co, tris
+
+def icosphere(level=2):
+    t = (1 + 5 ** 0.5) / 2
+    co = np.array([[-1, t, 0], [1, t, 0], [-1, -t, 0], [1, -t, 0], [0, -1, t], [0, 1, t],
+                   [0, -1, -t], [0, 1, -t], [t, 0, -1], [t, 0, 1], [-t, 0, -1], [-t, 0, 1]], dtype=np.float64)
+    tris = np.array([[0, 11, 5], [0, 5, 1], [0, 1, 7], [0, 7, 10], [0, 10, 11], [1, 5, 9], [5, 11, 4],
+                     [11, 10, 2], [10, 7, 6], [7, 1, 8], [3, 9, 4], [3, 4, 2], [3, 2, 6], [3, 6, 8],
+                     [3, 8, 9], [4, 9, 5], [2, 4, 11], [6, 2, 10], [8, 6, 7], [9, 8, 1]], dtype=np.int64)
+    for _ in range(level):
+        co, tris = subdivide(co, tris)
+    return co / np.linalg.norm(co, axis=1)[:, None], tris
+
+def box(level=2):
+    co = np.array([[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)], dtype=np.float64)
+    tris = np.array([[0, 1, 3], [0, 3, 2], [4, 6, 7], [4, 7, 5], [0, 4, 5], [0, 5, 1],
+                     [2, 3, 7], [2, 7, 6], [0, 2, 6], [0, 6, 4], [1, 5, 7], [1, 7, 3]], dtype=np.int64)
+    for _ in range(level):
+        co, tris = subdivide(co, tris)
+    return co, tris
+
+INDENTERS = {
+    "sphere": icosphere,
+    "box": box,
+}
+
+# A single hard object made of count indenters, each pressed into the soft
+# mesh along the normal of a surface vertex by depth times its radius
+def indenters(soft, kind, count, radius, depth, level, seed=0):
+    rng = np.random.default_rng(seed)
+    normals = core.vertexNormals(soft.co, soft.tris)
+    base_co, base_tris = INDENTERS[kind](level)
+    co, tris = [], []
+    # greedily picks surface vertices far enough apart that the indenters do not overlap
+    chosen = []
+    for i in rng.permutation(len(soft.co)):
+        if all(np.linalg.norm(soft.co[i] - soft.co[j]) > 2.5 * radius for j in chosen):
+            chosen.append(i)
+        if len(chosen) == count:
+            break
+    for k, i in enumerate(chosen):
+        center = soft.co[i] + normals[i] * radius * (1 - depth)
+        co.append(base_co * radius + center)
+        tris.append(base_tris + k * len(base_co))
+    return core.Mesh(np.concatenate(co), np.concatenate(tris))
+
+# Regression checks of the inside tests on axis-aligned meshes, where the
+# rays run through the edges and vertices of the triangulation
+def check():
+    # a cube pressed into a subdivided cube, their vertices line up
+    soft_co, _ = box(3)
+    hard_co, hard_tris = box(0)
+    hard_co = hard_co * 0.5 + [0, 0, 1.49]
+    inside = core.insideVerts(hard_co, hard_tris, soft_co)
+    strict = (np.abs(soft_co[:, :2]) < 0.5).all(1) & (soft_co[:, 2] > 0.99)
+    outside = (np.abs(soft_co[:, :2]) > 0.5).any(1) | (soft_co[:, 2] < 0.99)
+    assert inside[strict].all(), "aligned cube: %d of %d inner points missed" % ((~inside[strict]).sum(), strict.sum())
+    assert not inside[outside].any(), "aligned cube: outer points taken as inside"
+
+    # a plate thinner than a voxel, with points on its diagonals
+    plate_co, plate_tris = box(0)
+    plate_co = plate_co * [1, 1, 0.005]
+    g = np.linspace(-0.9, 0.9, 15)
+    points = np.array([[x, y, z] for x in g for y in g for z in (0.001, 0.01)])
+    expected = points[:, 2] < 0.005
+    for name, result in [("insideExact", core.insideExact(plate_co, plate_tris, points)),
+                         ("insideVerts", core.insideVerts(plate_co, plate_tris, points))]:
+        assert (result == expected).all(), "thin plate: %s misclassifies %d points" % (name, (result != expected).sum())
+    print("ok")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="time the denting stages without Blender")
+    parser.add_argument("--soft", default=BUNNY, help="OBJ file of the soft object, or sphere for a closed icosphere (the bunny is open)")
+    parser.add_argument("--subdivide", type=int, default=0, help="midpoint subdivisions of the soft object")
+    parser.add_argument("--indenter", choices=INDENTERS.keys(), default="sphere")
+    parser.add_argument("--density", type=int, nargs="+", default=[1, 4, 16], help="numbers of indenters")
+    parser.add_argument("--radius", type=float, default=0.05, help="indenter radius relative to the soft object size")
+    parser.add_argument("--depth", type=float, default=0.5, help="indentation depth relative to the indenter radius")
+    parser.add_argument("--level", type=int, default=2, help="subdivisions of the indenters")
+    parser.add_argument("--falloff", choices=["EUCLIDEAN", "GEODESIC"], default="EUCLIDEAN")
+    parser.add_argument("--voxel-resolution", type=int, default=64)
+    parser.add_argument("--volume-preservation", type=float, default=1.0, help="fraction of the lost volume to restore")
+    parser.add_argument("--no-solve-volume", action="store_true", help="use --volume-preservation as the volume factor")
+    parser.add_argument("--bake", type=int, default=0, help="bake this many frames of the first density moving in and out instead")
+    parser.add_argument("--check", action="store_true", help="run the inside test regression checks instead")
+    args = parser.parse_args()
+    if args.check:
+        check()
+        sys.exit()
+
+    if args.soft == "sphere":
+        co, tris = icosphere(3)
+    else:
+        co, tris = loadObj(args.soft)
+    for _ in range(args.subdivide):
+        co, tris = subdivide(co, tris)
+    soft = core.Mesh(co, tris)
+    size = np.linalg.norm(co.max(0) - co.min(0))
+    print(f"soft: {len(soft.co)} verts, {len(soft.tris)} tris")
+
+    if args.bake > 0:
+        hard = indenters(soft, args.indenter, args.density[0], args.radius * size, args.depth, args.level)
+        # slides the indenters out of the soft object along x and back in
+        offsets = np.abs(np.linspace(-1, 1, args.bake)) * args.radius * size * 4
+        def frames():
+            for offset in offsets:
+                matrix = np.eye(4)
+                matrix[0, 3] = offset
+                yield core.Mesh(hard.co, hard.tris, hard.edges, matrix)
+        timings = {}
+        start = time.perf_counter()
+        for frame, co in enumerate(core.bake(soft, frames(), volume_preservation=args.volume_preservation,
+                                             voxel_resolution=args.voxel_resolution, falloff_mode=args.falloff,
+                                             solve_volume=not args.no_solve_volume, timings=timings)):
+            pass
+        total = time.perf_counter() - start
+        print("%d frames" % args.bake + "".join("%10.1fms" % (timings.get(s, 0) * 1000) for s in STAGES) + "%10.1fms" % (total * 1000))
+        sys.exit()
+
+    print("%-8s %8s" % ("count", "hard") + "".join("%12s" % s for s in STAGES) + "%12s" % "total" + "%14s" % "volume error")
+    for count in args.density:
+        hard = indenters(soft, args.indenter, count, args.radius * size, args.depth, args.level)
+        cache = core.Cache()
+        # the second run only changes the displacement, as when tweaking it in Blender
+        for run, displace_increase in enumerate([0.02, 0.04]):
+            timings, volumes = {}, {}
+            start = time.perf_counter()
+            core.deform(soft, hard, displace_increase=displace_increase, voxel_resolution=args.voxel_resolution,
+                        falloff_mode=args.falloff, volume_preservation=args.volume_preservation,
+                        solve_volume=not args.no_solve_volume, cache=cache, timings=timings, volumes=volumes)
+            total = time.perf_counter() - start
+            # relative to the original volume
+            if volumes and volumes["closed"]:
+                error = "%13.4f%%" % ((volumes["result"] - volumes["target"]) / volumes["original"] * 100)
+            else:
+                error = "%14s" % ("open mesh" if volumes else "-")
+            label = "%-8d" % count if run == 0 else "%-8s" % "cached"
+            print(label + " %8d" % len(hard.co) + "".join("%10.1fms" % (timings.get(s, 0) * 1000) for s in STAGES) + "%10.1fms" % (total * 1000) + error)